@@ -0,0 +1,90 @@
+"""Read access to task_attempts for the recommendation engine.
+
+Only the columns mastery and task selection need are selected. The reasoning flag
+and hints_used are projected out of the ai_feedback / answer_data JSON server-side,
+so feedback texts and answer blobs never leave the database. Long histories are
+read in pages with a keyset cursor on (created_at, id) instead of growing offsets.
+ATTEMPT_HISTORY_DAYS optionally limits the reads to a recent time window.
+"""
+
+from __future__ import annotations
+
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Iterator, Optional
+
+from .services import get_admin_supabase
+
+ENGINE_COLUMNS = (
+    "id, user_id, zadanie_id, is_correct, created_at, "
+    "hints_used:answer_data->hints_used, reasoning:ai_feedback->poprawne_rozumowanie"
+)
+PAGE_SIZE = 1000
+USER_CHUNK = 100
+
+# Days of history the engine reads (0 = whole history). Older attempts then no longer
+# count towards mastery or mark a task as attempted.
+HISTORY_DAYS = float(os.environ.get("ATTEMPT_HISTORY_DAYS", "0"))
+
+
+def history_start(days: float = HISTORY_DAYS) -> Optional[datetime]:
+    """Start of the configured history window, or None for the whole history."""
+    if days <= 0:
+        return None
+    return datetime.now(timezone.utc) - timedelta(days=days)
+
+
+def _after_cursor(created_at: str, attempt_id, newest_first: bool) -> str:
+    """PostgREST or-filter for rows strictly after (created_at, id) in the paging order."""
+    op = "lt" if newest_first else "gt"
+    return f'created_at.{op}."{created_at}",and(created_at.eq."{created_at}",id.{op}.{attempt_id})'
+
+
+def iter_attempts(
+    user_id: Optional[str] = None,
+    user_ids: Optional[list[str]] = None,
+    since: Optional[datetime] = None,
+    newest_first: bool = False,
+    columns: str = ENGINE_COLUMNS,
+    page_size: int = PAGE_SIZE,
+) -> Iterator[dict]:
+    """Attempts of one student, several students or (neither given) everyone, page by page.
+
+    columns must include id and created_at (the cursor). Rows come in created_at order
+    (newest_first for recommendation inputs, oldest first for mastery folds).
+    """
+    supabase = get_admin_supabase()
+    groups = [user_ids[i:i + USER_CHUNK] for i in range(0, len(user_ids), USER_CHUNK)] if user_ids else [None]
+    for group in groups:
+        cursor = None
+        while True:
+            query = supabase.table("task_attempts").select(columns)
+            if user_id:
+                query = query.eq("user_id", user_id)
+            if group:
+                query = query.in_("user_id", group)
+            if since:
+                query = query.gte("created_at", since.isoformat())
+            if cursor:
+                query = query.or_(_after_cursor(*cursor, newest_first))
+            res = (
+                query.order("created_at", desc=newest_first)
+                .order("id", desc=newest_first)
+                .limit(page_size)
+                .execute()
+            )
+            page = res.data or []
+            yield from page
+            if len(page) < page_size:
+                break
+            cursor = (page[-1]["created_at"], page[-1]["id"])
+
+
+def fetch_attempts(user_id: str, since: Optional[datetime] = None) -> list[dict]:
+    """A student's attempts (engine columns), newest first, within the history window by default."""
+    return list(iter_attempts(user_id, since=since or history_start(), newest_first=True))
+
+
+def fetch_attempted_task_ids(user_id: str, since: Optional[datetime] = None) -> list[str]:
+    rows = iter_attempts(user_id, since=since or history_start(), columns="id, zadanie_id, created_at")
+    return [r["zadanie_id"] for r in rows]
@@ -1,10 +1,35 @@
 from contextlib import asynccontextmanager
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Path as PathParam, Request
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from .routers import lessons, quizzes, auth, webhooks, admin, tasks
-from .neo4j import init_neo4j, close_neo4j, get_neo4j
+from .neo4j import (
+    close_neo4j,
+    close_neo4j_async,
+    ensure_schema,
+    get_neo4j,
+    init_neo4j,
+    init_neo4j_async,
+)
+from .skill_engine import INDEXED_QUERIES
+from .skill_graph import start_graph_refresher
+from .tikz import (
+    CachedSvg,
+    RENDER_STAGE,
+    RenderQueueFull,
+    TikzRenderError,
+    build_tikz_format,
+    get_render_queue,
+    get_tikz_cache,
+    prepare_tikz,
+    render_batch_async,
+    render_cached_async,
+    single_flight_stats,
+    tikz_key,
+)
+from .metrics import render_metrics
+from .schemas import TikzBatchRequest
 import os
 from dotenv import load_dotenv
 
@@ -13,8 +38,18 @@ load_dotenv()
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    init_neo4j()
+    driver = init_neo4j()
+    await init_neo4j_async()
+    try:
+        ensure_schema(driver, INDEXED_QUERIES)
+    except Exception as e:
+        logger.warning("Neo4j schema bootstrap failed: %s", e)
+    build_tikz_format()
+    graph_refresher = start_graph_refresher(driver)
     yield
+    if graph_refresher:
+        graph_refresher.cancel()
+    await close_neo4j_async()
     close_neo4j()
 
 
@@ -46,12 +81,8 @@ app.include_router(tasks.router)
 from pathlib import Path
 import base64
 import logging
-import re
-import subprocess
-import tempfile
-import uuid
 from fastapi import Body
-from fastapi.responses import FileResponse, HTMLResponse, Response
+from fastapi.responses import FileResponse, HTMLResponse, PlainTextResponse, Response
 
 logger = logging.getLogger(__name__)
 
@@ -73,89 +104,127 @@ async def neo4j_status():
     except Exception as e:
         return {"connected": False, "message": str(e)}
 
-import re
+def _decode_tikz(t: str) -> str:
+    """Base64 payload → prepared TikZ; HTTPException(400) when unusable."""
+    try:
+        with RENDER_STAGE.time("decode"):
+            raw = base64.b64decode(t, validate=True).decode("utf-8")
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid base64")
+    
+    with RENDER_STAGE.time("prepare"):
+        tikz = prepare_tikz(raw)
+    if not tikz.strip():
+        raise HTTPException(status_code=400, detail="Empty TikZ")
+    return tikz
 
-def _prepare_tikz(raw: str) -> str:
-    """Sanitize TikZ code for web-based compilation."""
-    raw = re.sub(r'\\n(?![a-zA-Z])', '\n', raw)
-    raw = re.sub(r'\\t(?![a-zA-Z])', '\t', raw)
-    raw = raw.replace('\u00A0', ' ')
 
-    
-    _PL_MAP = str.maketrans("ąćęłńóśźżĄĆĘŁŃÓŚŹŻ", "acelnoszzACELNOSZZ")
-    raw = raw.translate(_PL_MAP)
-    
-    #raw = raw.replace("font=\\sffamily", "").replace("font=\\sansmath", "")
-    #raw = re.sub(r",\s*font=[^,\]]+", "", raw)
-    #raw = re.sub(r"font=[^,\]]+,\s*", "", raw)
-    #raw = re.sub(r"font=[^,\]\}]+", "", raw)
-    
-    if "\\begin{center}" in raw:
-        raw = raw.replace("\\begin{center}", "").replace("\\end{center}", "").strip()
-    
-    
-    return raw
+SVG_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+def _svg_headers(key: str) -> dict[str, str]:
+    return {
+        "ETag": f'"{key}"',
+        "Cache-Control": SVG_CACHE_CONTROL,
+        "Vary": "Accept-Encoding",
+        "Content-Location": f"/api/tikz-svg/{key}",
+    }
+
+
+def _svg_response(request: Request, key: str, entry: CachedSvg) -> Response:
+    """Serve the precompressed variant the client accepts, with content-hash caching headers."""
+    body, encoding = entry.negotiate(request.headers.get("accept-encoding", ""))
+    headers = _svg_headers(key)
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type="image/svg+xml", headers=headers)
+
+
+def _render_busy(e: RenderQueueFull) -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail="Diagram renderer busy, retry later",
+        headers={"Retry-After": str(e.retry_after)},
+    )
 
 
 # TikZ to SVG (server-side pdflatex + pdf2svg) - reliable, no nullfont
 @app.post("/api/tikz-svg")
-async def tikz_to_svg(t: str = Body(..., embed=True)):
+async def tikz_to_svg(request: Request, t: str = Body(..., embed=True)):
+    tikz = _decode_tikz(t)
+
     try:
-        raw = base64.b64decode(t, validate=True).decode("utf-8")
-    except Exception:
-        raise HTTPException(status_code=400, detail="Invalid base64")
-    
-    tikz = _prepare_tikz(raw)
-    if not tikz.strip():
-        raise HTTPException(status_code=400, detail="Empty TikZ")
+        entry = await render_cached_async(tikz)
+    except TikzRenderError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    except RenderQueueFull as e:
+        raise _render_busy(e)
+
+    # Content-Location points at the cacheable GET URL for this diagram
+    return _svg_response(request, tikz_key(tikz), entry)
+
+
+# Many diagrams in one TeX run; returns {"svgs": {index: svg}, "keys": {index: key}, "errors": {index: {status, detail}}}
+@app.post("/api/tikz-svg/batch")
+async def tikz_to_svg_batch(req: TikzBatchRequest):
+    svgs: dict[str, str] = {}
+    keys: dict[str, str] = {}
+    errors: dict[str, dict] = {}
+    tikzs, slots = [], []
+    for i, t in enumerate(req.items):
+        try:
+            tikzs.append(_decode_tikz(t))
+            slots.append(i)
+        except HTTPException as e:
+            errors[str(i)] = {"status": e.status_code, "detail": e.detail}
 
-    name = f"tikz_{uuid.uuid4().hex[:12]}"
-    with tempfile.TemporaryDirectory() as tmp:
-        tex_path = Path(tmp) / f"{name}.tex"
-        
-        # CZYSTY pdflatex. Żadnego wpisu 'dvisvgm' w nawiasach kwadratowych.
-        tex_path.write_text(
-            r"""\documentclass[tikz,border=20pt]{standalone}
-\usepackage[utf8]{inputenc}
-\usepackage[T1]{fontenc}
-\usepackage{lmodern}
-\usepackage{amsmath}
-\usepackage{pgfplots}
-\pgfplotsset{compat=1.18}
-\usetikzlibrary{angles,quotes,calc,matrix,arrows.meta,positioning}
-\begin{document}
-"""
-            + tikz
-            + r"""
-\end{document}
-""",
-            encoding="utf-8",
-        )
-        
-        # 1. Kompilacja do twardego PDF. On nigdy nie gubi współrzędnych.
-        pdflatex = subprocess.run(
-            ["pdflatex", "-interaction=nonstopmode", "-halt-on-error", str(tex_path)],
-            cwd=tmp, capture_output=True, text=True, timeout=30
-        )
-        pdf_path = Path(tmp) / f"{name}.pdf"
-        if not pdf_path.exists():
-            log_preview = (pdflatex.stdout or "") + (pdflatex.stderr or "")
-            raise HTTPException(status_code=422, detail=f"pdflatex failed: {log_preview[-500:]}")
-
-        # 2. Konwersja na SVG za pomocą pdf2svg (które działa, bo masz już poppler-data w systemie)
-        svg_path = Path(tmp) / f"{name}.svg"
-        pdf2svg = subprocess.run(
-            ["pdf2svg", str(pdf_path), str(svg_path)],
-            cwd=tmp, capture_output=True, text=True, timeout=10
-        )
-        
-        if not svg_path.exists() or pdf2svg.returncode != 0:
-            err = (pdf2svg.stdout or "") + (pdf2svg.stderr or "")
-            raise HTTPException(status_code=500, detail=f"pdf2svg error: {err}")
-
-        svg_content = svg_path.read_text(encoding="utf-8")
-        
-    return Response(content=svg_content, media_type="image/svg+xml")
+    try:
+        results = await render_batch_async(tikzs)
+    except RenderQueueFull as e:
+        raise _render_busy(e)
+
+    for i, tikz, result in zip(slots, tikzs, results):
+        if isinstance(result, CachedSvg):
+            svgs[str(i)] = result.svg.decode("utf-8")
+            keys[str(i)] = tikz_key(tikz)
+        elif isinstance(result, TikzRenderError):
+            errors[str(i)] = {"status": result.status_code, "detail": result.detail}
+        elif isinstance(result, RenderQueueFull):
+            errors[str(i)] = {"status": 503, "detail": "Diagram renderer busy, retry later"}
+        else:
+            errors[str(i)] = {"status": 500, "detail": str(result)}
+
+    return {"svgs": svgs, "keys": keys, "errors": errors}
+
+
+# TikZ render cache and queue counters (no auth, like /api/neo4j/status)
+@app.get("/api/tikz-svg/stats")
+async def tikz_cache_stats():
+    return {
+        "cache": get_tikz_cache().stats(),
+        "queue": get_render_queue().stats(),
+        "single_flight": single_flight_stats(),
+    }
+
+
+# Prometheus scrape endpoint (render stage histograms, cache/queue counters)
+@app.get("/api/metrics")
+async def metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
+# Rendered diagram by content hash: immutable, so browsers cache it forever
+@app.get("/api/tikz-svg/{key}")
+async def tikz_svg_by_key(request: Request, key: str = PathParam(..., pattern="^[0-9a-f]{64}$")):
+    if_none_match = request.headers.get("if-none-match", "")
+    tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    if f'"{key}"' in tags or "*" in tags:
+        return Response(status_code=304, headers=_svg_headers(key))
+
+    entry = await get_tikz_cache().get_async(key)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Diagram not rendered")
+    return _svg_response(request, key, entry)
 
 # Config endpoint for frontend (Supabase anon key - no auth required)
 @app.get("/api/config")
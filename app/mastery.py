@@ -0,0 +1,346 @@
+"""Materialized per-student, per-skill mastery (Supabase table student_skill_mastery).
+
+Instead of folding a student's whole task_attempts history on every
+/tasks/recommended and /tasks/skill-map call, one running record per
+(user, skill) is kept up to date when /tasks/check stores an attempt:
+
+    create table student_skill_mastery (
+        user_id uuid not null references auth.users (id) on delete cascade,
+        skill_id text not null,
+        score_sum double precision not null default 0,
+        attempts integer not null default 0,
+        last_correct_at timestamptz,
+        streak integer not null default 0,
+        next_due_at timestamptz,
+        updated_at timestamptz not null default now(),
+        primary key (user_id, skill_id)
+    );
+    create index student_skill_mastery_due on student_skill_mastery (user_id, next_due_at);
+
+next_due_at is when the skill next comes up for spaced-repetition review (null until the
+first correct answer). It is rewritten with the rest of the record, so due reviews are an
+index range scan up to now() (load_due_reviews, count_due_reviews). On a table created
+before the column existed, add it and run the backfill:
+
+    alter table student_skill_mastery add column if not exists next_due_at timestamptz;
+    create index if not exists student_skill_mastery_due on student_skill_mastery (user_id, next_due_at);
+
+Attempts are folded in server-side, in one statement, so concurrent checks by the same
+student cannot overwrite each other's increments (record_attempt calls it over RPC). A
+student without records is left untouched (false is returned) and rebuilt from history
+instead; rebuilds replace all of a student's records in one transaction. Both functions
+hold the same per-student lock, so an increment never lands between a rebuild's delete
+and insert:
+
+    create or replace function skill_review_due_at(
+        last_correct_at timestamptz, streak integer, score_sum double precision,
+        intervals_days double precision[]
+    ) returns timestamptz language sql immutable as $$
+        select case when score_sum > 0 and last_correct_at is not null then
+            last_correct_at + intervals_days[least(streak, array_length(intervals_days, 1) - 1) + 1]
+                * interval '1 day'
+        end
+    $$;
+
+    create or replace function record_skill_attempt(
+        p_user_id uuid, p_skill_ids text[], p_score double precision, p_created_at timestamptz,
+        p_keeps_streak boolean, p_intervals_days double precision[], p_require_existing boolean
+    ) returns boolean language plpgsql as $$
+    begin
+        perform pg_advisory_xact_lock(hashtext('student_skill_mastery:' || p_user_id));
+        if p_require_existing
+           and not exists (select 1 from student_skill_mastery where user_id = p_user_id) then
+            return false;
+        end if;
+        insert into student_skill_mastery as m
+            (user_id, skill_id, score_sum, attempts, last_correct_at, streak, next_due_at, updated_at)
+        select p_user_id, sid, p_score, 1,
+               case when p_score > 0 then p_created_at end,
+               case when p_keeps_streak then 1 else 0 end,
+               skill_review_due_at(case when p_score > 0 then p_created_at end,
+                                   case when p_keeps_streak then 1 else 0 end, p_score, p_intervals_days),
+               now()
+        from unnest(p_skill_ids) as sid
+        on conflict (user_id, skill_id) do update set
+            score_sum = m.score_sum + excluded.score_sum,
+            attempts = m.attempts + 1,
+            last_correct_at = greatest(m.last_correct_at, excluded.last_correct_at),
+            streak = case when p_keeps_streak then m.streak + 1 else 0 end,
+            next_due_at = skill_review_due_at(
+                greatest(m.last_correct_at, excluded.last_correct_at),
+                case when p_keeps_streak then m.streak + 1 else 0 end,
+                m.score_sum + excluded.score_sum, p_intervals_days),
+            updated_at = now();
+        return true;
+    end
+    $$;
+
+    create or replace function replace_skill_mastery(p_user_id uuid, p_rows jsonb)
+    returns void language plpgsql as $$
+    begin
+        perform pg_advisory_xact_lock(hashtext('student_skill_mastery:' || p_user_id));
+        delete from student_skill_mastery where user_id = p_user_id;
+        insert into student_skill_mastery
+            (user_id, skill_id, score_sum, attempts, last_correct_at, streak, next_due_at, updated_at)
+        select p_user_id, r.skill_id, r.score_sum, r.attempts, r.last_correct_at, r.streak,
+               r.next_due_at, now()
+        from jsonb_to_recordset(p_rows) as r(
+            skill_id text, score_sum double precision, attempts integer,
+            last_correct_at timestamptz, streak integer, next_due_at timestamptz);
+    end
+    $$;
+
+Records are keyed by the task→skill mapping at the time of the attempt, so run the
+backfill after importing content that changes it (or once after creating the table):
+
+    python -m app.mastery [--user USER_ID]
+
+If the table is missing or unreadable, callers fall back to compute_skill_mastery.
+"""
+
+from __future__ import annotations
+
+import argparse
+import logging
+from datetime import datetime, timezone
+from collections import Counter
+from typing import Iterable, Optional
+
+from .attempts import PAGE_SIZE, USER_CHUNK, iter_attempts
+from .services import get_admin_supabase
+from .skill_engine import (
+    MASTERY_WEIGHTS,
+    SPACED_INTERVALS_DAYS,
+    _compute_attempt_score,
+    _parse_created,
+    fold_skill_records,
+    mastery_from_record,
+)
+
+logger = logging.getLogger(__name__)
+
+MASTERY_TABLE = "student_skill_mastery"
+
+
+def _record_from_row(row: dict) -> dict:
+    return {
+        "score_sum": float(row.get("score_sum") or 0.0),
+        "attempts": int(row.get("attempts") or 0),
+        "last_correct_at": _parse_created(row.get("last_correct_at")),
+        "streak": int(row.get("streak") or 0),
+    }
+
+
+def _row_from_record(user_id: str, skill_id: str, record: dict) -> dict:
+    last = record["last_correct_at"]
+    due = mastery_from_record(record)["next_due_at"]
+    return {
+        "user_id": user_id,
+        "skill_id": skill_id,
+        "score_sum": record["score_sum"],
+        "attempts": record["attempts"],
+        "last_correct_at": last.isoformat() if last else None,
+        "streak": record["streak"],
+        "next_due_at": due.isoformat() if due else None,
+        "updated_at": datetime.now(timezone.utc).isoformat(),
+    }
+
+
+def _mastery_from_row(row: dict) -> dict:
+    mastery = mastery_from_record(_record_from_row(row))
+    mastery["next_due_at"] = _parse_created(row.get("next_due_at"))
+    return mastery
+
+
+def load_mastery(user_id: str) -> Optional[dict[str, dict]]:
+    """Stored mastery in compute_skill_mastery's format, or None when unavailable.
+
+    next_due_at is the stored review time rather than one recomputed from the record.
+    None (not {}) is also returned when the student has no stored records, so a student
+    whose history predates the table is computed from attempts instead of looking new.
+    """
+    try:
+        res = (
+            get_admin_supabase()
+            .table(MASTERY_TABLE)
+            .select("skill_id, score_sum, attempts, last_correct_at, streak, next_due_at")
+            .eq("user_id", user_id)
+            .execute()
+        )
+    except Exception as e:
+        logger.debug("mastery table unavailable: %s", e)
+        return None
+    rows = res.data or []
+    if not rows:
+        return None
+    return {row["skill_id"]: _mastery_from_row(row) for row in rows}
+
+
+def load_due_reviews(user_id: str, now: Optional[datetime] = None) -> Optional[list[dict]]:
+    """Skills due for review ({skill_id, next_due_at}, most overdue first), or None when unavailable.
+
+    Like load_mastery, None is also returned for a student without stored records.
+    """
+    now = now or datetime.now(timezone.utc)
+    try:
+        res = (
+            get_admin_supabase()
+            .table(MASTERY_TABLE)
+            .select("skill_id, next_due_at")
+            .eq("user_id", user_id)
+            .lte("next_due_at", now.isoformat())
+            .order("next_due_at")
+            .execute()
+        )
+        if not res.data and _has_no_records(user_id):
+            return None
+    except Exception as e:
+        logger.debug("mastery table unavailable: %s", e)
+        return None
+    return res.data or []
+
+
+def _after_record(user_id: str, skill_id: str) -> str:
+    """PostgREST or-filter for records strictly after (user_id, skill_id)."""
+    return f'user_id.gt."{user_id}",and(user_id.eq."{user_id}",skill_id.gt."{skill_id}")'
+
+
+def count_due_reviews(user_ids: list[str], now: Optional[datetime] = None) -> Optional[dict[str, int]]:
+    """{user_id: number of skills due for review} for dashboards, or None when unavailable.
+
+    A single student is an exact count (no rows transferred); for several students only
+    the key of each due record is read, paged with a keyset cursor on (user_id, skill_id).
+    Students without stored records are left out, so callers can compute them from attempts.
+    """
+    now = now or datetime.now(timezone.utc)
+    supabase = get_admin_supabase()
+    try:
+        if len(user_ids) == 1:
+            res = (
+                supabase.table(MASTERY_TABLE)
+                .select("skill_id", count="exact", head=True)
+                .eq("user_id", user_ids[0])
+                .lte("next_due_at", now.isoformat())
+                .execute()
+            )
+            if not res.count and _has_no_records(user_ids[0]):
+                return {}
+            return {user_ids[0]: res.count or 0}
+        counts: Counter = Counter({uid: 0 for uid in user_ids})
+        for i in range(0, len(user_ids), USER_CHUNK):
+            cursor = None
+            while True:
+                query = (
+                    supabase.table(MASTERY_TABLE)
+                    .select("user_id, skill_id")
+                    .in_("user_id", user_ids[i:i + USER_CHUNK])
+                    .lte("next_due_at", now.isoformat())
+                )
+                if cursor:
+                    query = query.or_(_after_record(*cursor))
+                res = query.order("user_id").order("skill_id").limit(PAGE_SIZE).execute()
+                page = res.data or []
+                counts.update(row["user_id"] for row in page)
+                if len(page) < PAGE_SIZE:
+                    break
+                cursor = (page[-1]["user_id"], page[-1]["skill_id"])
+        return {uid: n for uid, n in counts.items() if n or not _has_no_records(uid)}
+    except Exception as e:
+        logger.debug("mastery table unavailable: %s", e)
+        return None
+
+
+def record_attempt(
+    user_id: str,
+    skill_ids: Iterable[str],
+    attempt: dict,
+    zadanie_skill_map: Optional[dict[str, tuple[str, ...]]] = None,
+) -> None:
+    """Fold one freshly stored attempt into the student's records: O(skills of the task).
+
+    The increment is one atomic upsert in the database (record_skill_attempt, the same
+    rules as apply_attempt_score). If the student has no records yet but zadanie_skill_map
+    is given, the function writes nothing and their full history (which already includes
+    this attempt) is rebuilt instead, so an un-backfilled student does not end up with
+    mastery for only this task's skills.
+    """
+    skill_ids = list(dict.fromkeys(skill_ids))
+    if not skill_ids:
+        return
+    score = _compute_attempt_score(attempt)
+    created = _parse_created(attempt.get("created_at")) or datetime.now(timezone.utc)
+    res = get_admin_supabase().rpc("record_skill_attempt", {
+        "p_user_id": user_id,
+        "p_skill_ids": skill_ids,
+        "p_score": score,
+        "p_created_at": created.isoformat(),
+        "p_keeps_streak": score >= MASTERY_WEIGHTS["answer_only_correct"],
+        "p_intervals_days": SPACED_INTERVALS_DAYS,
+        "p_require_existing": zadanie_skill_map is not None,
+    }).execute()
+    if res.data is False:
+        rebuild_user_mastery(user_id, zadanie_skill_map)
+
+
+def _has_no_records(user_id: str) -> bool:
+    res = (
+        get_admin_supabase()
+        .table(MASTERY_TABLE)
+        .select("skill_id")
+        .eq("user_id", user_id)
+        .limit(1)
+        .execute()
+    )
+    return not res.data
+
+
+def _write_user_records(user_id: str, records: dict[str, dict]) -> None:
+    """Replace all of a student's records in one transaction (replace_skill_mastery)."""
+    rows = [_row_from_record(user_id, sid, record) for sid, record in records.items()]
+    get_admin_supabase().rpc("replace_skill_mastery", {"p_user_id": user_id, "p_rows": rows}).execute()
+
+
+def rebuild_user_mastery(user_id: str, zadanie_skill_map: dict[str, tuple[str, ...]]) -> int:
+    """Recompute one student's records from their full history (ignores ATTEMPT_HISTORY_DAYS). Returns the number of skills."""
+    records = fold_skill_records(list(iter_attempts(user_id)), zadanie_skill_map)
+    _write_user_records(user_id, records)
+    return len(records)
+
+
+def rebuild_all_mastery(zadanie_skill_map: dict[str, tuple[str, ...]]) -> dict:
+    """Backfill every student that has attempts."""
+    by_user: dict[str, list[dict]] = {}
+    for att in iter_attempts():
+        by_user.setdefault(att["user_id"], []).append(att)
+    skills = 0
+    for user_id, attempts in by_user.items():
+        records = fold_skill_records(attempts, zadanie_skill_map)
+        _write_user_records(user_id, records)
+        skills += len(records)
+    return {"students": len(by_user), "skill_records": skills}
+
+
+def main() -> None:
+    from .neo4j import close_neo4j, init_neo4j
+    from .skill_graph import load_graph_snapshot
+
+    parser = argparse.ArgumentParser(description="Rebuild student_skill_mastery from task_attempts.")
+    parser.add_argument("--user", default=None, help="rebuild a single student (default: everyone)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    driver = init_neo4j()
+    if not driver:
+        raise SystemExit("Neo4j not available (check NEO4J_URI / NEO4J_AUTH)")
+    try:
+        zadanie_skill_map = load_graph_snapshot(driver).zadanie_skill_map
+    finally:
+        close_neo4j()
+    if args.user:
+        print({"student": args.user, "skill_records": rebuild_user_mastery(args.user, zadanie_skill_map)})
+    else:
+        print(rebuild_all_mastery(zadanie_skill_map))
+
+
+if __name__ == "__main__":
+    main()
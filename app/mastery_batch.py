@@ -0,0 +1,303 @@
+"""Vectorized student × skill mastery for whole classes.
+
+Loads the attempts of many students in bulk into columnar NumPy arrays and
+computes, in one pass, the same per-skill aggregates as compute_skill_mastery:
+level (average score), attempt count, last correct timestamp and the most
+recent run of correct answers (spaced-repetition streak).
+
+Used by class-level admin views instead of calling fetch_skill_map per student,
+and by recommend_for_students to start a session for a whole class at once.
+"""
+
+from __future__ import annotations
+
+from datetime import datetime, timezone
+from typing import Iterable, NamedTuple, Optional
+
+import numpy as np
+from neo4j import Driver
+
+from .attempts import USER_CHUNK, history_start, iter_attempts
+from .services import get_admin_supabase
+from .skill_engine import (
+    MASTERY_THRESHOLD,
+    MASTERY_WEIGHTS,
+    SPACED_INTERVALS_DAYS,
+    _parse_created,
+    choose_task_id,
+    review_due_at,
+    fetch_zadania_by_ids,
+    recent_dzial_ids,
+)
+from .skill_graph import GraphSnapshot
+
+NO_TIME = np.iinfo(np.int64).min  # µs timestamp for "missing"; sorts as the oldest
+
+
+class MasteryMatrix(NamedTuple):
+    user_ids: list[str]
+    skill_ids: list[str]
+    score_sum: np.ndarray        # (users, skills) float64
+    attempts: np.ndarray         # (users, skills) int64
+    last_correct_us: np.ndarray  # (users, skills) int64 µs since epoch, NO_TIME if never correct
+    streak: np.ndarray           # (users, skills) int64, most recent run of correct answers
+
+    @property
+    def level(self) -> np.ndarray:
+        out = np.zeros_like(self.score_sum)
+        np.divide(self.score_sum, self.attempts, out=out, where=self.attempts > 0)
+        return out
+
+    @property
+    def next_due_us(self) -> np.ndarray:
+        """(users, skills) int64 µs of the next spaced-repetition review, NO_TIME if none."""
+        interval_days = np.asarray(SPACED_INTERVALS_DAYS, dtype=np.int64)
+        interval_us = interval_days[np.minimum(self.streak, len(SPACED_INTERVALS_DAYS) - 1)] * 86_400_000_000
+        has_due = (self.score_sum > 0) & (self.last_correct_us != NO_TIME)
+        return np.where(has_due, self.last_correct_us + interval_us, NO_TIME)
+
+    def due_counts(self, now: Optional[datetime] = None) -> np.ndarray:
+        """Skills due for review per student (same rule as get_skills_due_for_review)."""
+        now_us = int((now or datetime.now(timezone.utc)).timestamp() * 1_000_000)
+        due_at = self.next_due_us
+        return ((due_at != NO_TIME) & (due_at <= now_us)).sum(axis=1)
+
+    def for_user(self, user_id: str) -> dict[str, dict]:
+        """One student's row in compute_skill_mastery's format (attempted skills only)."""
+        row = self.user_ids.index(user_id)
+        level = self.level[row]
+        out = {}
+        for col in np.flatnonzero(self.attempts[row]):
+            last = int(self.last_correct_us[row, col])
+            last_correct_at = None if last == NO_TIME else datetime.fromtimestamp(last / 1e6, tz=timezone.utc)
+            streak = int(self.streak[row, col])
+            out[self.skill_ids[col]] = {
+                "level": float(level[col]),
+                "attempts": int(self.attempts[row, col]),
+                "last_correct_at": last_correct_at,
+                "interval_index": min(streak, len(SPACED_INTERVALS_DAYS) - 1),
+                "next_due_at": review_due_at(last_correct_at, streak) if self.score_sum[row, col] > 0 else None,
+            }
+        return out
+
+
+def fetch_attempt_rows(user_ids: list[str], since: Optional[datetime] = None) -> list[dict]:
+    """Attempts of all given students (projected engine columns), oldest first, in bulk."""
+    return list(iter_attempts(user_ids=user_ids, since=since or history_start()))
+
+
+def fetch_locked_skills(user_ids: list[str]) -> dict[str, set[str]]:
+    """Admin-locked skill ids of all given students, in bulk."""
+    supabase = get_admin_supabase()
+    locked: dict[str, set[str]] = {uid: set() for uid in user_ids}
+    try:
+        for i in range(0, len(user_ids), USER_CHUNK):
+            res = (
+                supabase.table("student_skill_locks")
+                .select("user_id, skill_id")
+                .in_("user_id", user_ids[i:i + USER_CHUNK])
+                .execute()
+            )
+            for row in res.data or []:
+                locked.setdefault(row["user_id"], set()).add(row["skill_id"])
+    except Exception:
+        pass
+    return locked
+
+
+def _parse_timestamps(values: Iterable) -> np.ndarray:
+    """ISO timestamps → int64 µs (UTC). Supabase returns UTC, parsed without per-row Python."""
+    arr = np.array([v if isinstance(v, str) else "" for v in values], dtype=str)
+    if not arr.size:
+        return np.empty(0, dtype=np.int64)
+    stripped = np.char.replace(np.char.replace(arr, "+00:00", ""), "Z", "")
+    # Any other UTC offset (or junk) goes through the scalar parser
+    odd = (np.char.rfind(stripped, "+") >= 19) | (np.char.rfind(stripped, "-") >= 19)
+    out = np.full(arr.shape, NO_TIME, dtype=np.int64)
+    regular = ~odd
+    try:
+        parsed = stripped[regular].astype("datetime64[us]")
+    except ValueError:
+        odd[:] = True
+    else:
+        out[regular] = np.where(np.isnat(parsed), NO_TIME, parsed.astype(np.int64))
+    for i in np.flatnonzero(odd):
+        dt = _parse_created(str(arr[i]))
+        if dt is not None:
+            out[i] = int(dt.timestamp() * 1_000_000)
+    return out
+
+
+def _reasoning(row: dict):
+    if "reasoning" in row:
+        return row["reasoning"]
+    return (row.get("ai_feedback") or {}).get("poprawne_rozumowanie")
+
+
+def _hints(row: dict) -> float:
+    hints = row["hints_used"] if "hints_used" in row else (row.get("answer_data") or {}).get("hints_used")
+    try:
+        return float(hints or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _attempt_scores(correct: np.ndarray, reasoning: np.ndarray, hints: np.ndarray) -> np.ndarray:
+    """Vectorized _compute_attempt_score."""
+    partial = np.maximum(0.1, MASTERY_WEIGHTS["answer_only_correct"] - hints * 0.15)
+    score = np.where(
+        reasoning == 1,
+        MASTERY_WEIGHTS["answer_and_reasoning"],
+        np.where(reasoning == 0, MASTERY_WEIGHTS["answer_correct_reasoning_wrong"], partial),
+    )
+    return np.where(correct, score, MASTERY_WEIGHTS["incorrect"])
+
+
+_skill_csr: dict[str, tuple[list[str], np.ndarray, np.ndarray]] = {}
+
+
+def _task_skill_csr(graph: GraphSnapshot) -> tuple[list[str], np.ndarray, np.ndarray]:
+    """(skill ids, row pointers, skill columns): task index → skill columns, cached per graph version."""
+    cached = _skill_csr.get(graph.version)
+    if cached is not None:
+        return cached
+    skill_ids = list(graph.all_skills)
+    skill_col = {sid: i for i, sid in enumerate(skill_ids)}
+    ptr = np.zeros(len(graph.task_ids) + 1, dtype=np.int64)
+    cols: list[int] = []
+    for i, zid in enumerate(graph.task_ids):
+        for sid in graph.zadanie_skill_map.get(zid, ()):
+            if sid not in skill_col:
+                skill_col[sid] = len(skill_ids)
+                skill_ids.append(sid)
+            cols.append(skill_col[sid])
+        ptr[i + 1] = len(cols)
+    csr = (skill_ids, ptr, np.array(cols, dtype=np.int64))
+    _skill_csr.clear()
+    _skill_csr[graph.version] = csr
+    return csr
+
+
+def compute_mastery_matrix(rows: list[dict], graph: GraphSnapshot, user_ids: list[str]) -> MasteryMatrix:
+    """Student × skill mastery from attempt rows (projected or full task_attempts rows, any order)."""
+    skill_ids, ptr, cols = _task_skill_csr(graph)
+    n_users, n_skills = len(user_ids), len(skill_ids)
+    user_pos = {uid: i for i, uid in enumerate(user_ids)}
+    tri = {True: 1, False: 0}
+
+    users = np.fromiter((user_pos.get(r.get("user_id"), -1) for r in rows), np.int64, len(rows))
+    tasks = np.fromiter((graph.task_index.get(r.get("zadanie_id"), -1) for r in rows), np.int64, len(rows))
+    correct = np.fromiter((bool(r.get("is_correct")) for r in rows), bool, len(rows))
+    reasoning = np.fromiter((tri.get(_reasoning(r), -1) for r in rows), np.int8, len(rows))
+    hints = np.fromiter((_hints(r) for r in rows), np.float64, len(rows))
+    created = _parse_timestamps(r.get("created_at") for r in rows)
+    score = _attempt_scores(correct, reasoning, hints)
+
+    keep = (users >= 0) & (tasks >= 0)
+    users, tasks, score, created = users[keep], tasks[keep], score[keep], created[keep]
+
+    # One (attempt, skill) pair per skill tested by the attempt's task
+    per_task = ptr[tasks + 1] - ptr[tasks]
+    total = int(per_task.sum())
+    first = np.repeat(ptr[tasks], per_task)
+    offset = np.arange(total) - np.repeat(np.cumsum(per_task) - per_task, per_task)
+    skill = cols[first + offset]
+    key = np.repeat(users, per_task) * n_skills + skill
+    score = np.repeat(score, per_task)
+    created = np.repeat(created, per_task)
+
+    flat = n_users * n_skills
+    score_sum = np.zeros(flat)
+    attempts = np.zeros(flat, dtype=np.int64)
+    last_correct = np.full(flat, NO_TIME, dtype=np.int64)
+    streak = np.zeros(flat, dtype=np.int64)
+
+    if total:
+        # Chronological within each (user, skill); stable, so equal timestamps keep row order
+        order = np.lexsort((created, key))
+        key, score, created = key[order], score[order], created[order]
+        starts = np.flatnonzero(np.r_[True, key[1:] != key[:-1]])
+        ends = np.r_[starts[1:], total] - 1
+        group = key[starts]
+
+        score_sum[group] = np.add.reduceat(score, starts)
+        attempts[group] = ends - starts + 1
+        correct_at = np.where((score > 0) & (created != NO_TIME), created, NO_TIME)
+        last_correct[group] = np.maximum.reduceat(correct_at, starts)
+        breaks = np.where(score < MASTERY_WEIGHTS["answer_only_correct"], np.arange(total), -1)
+        last_break = np.maximum.reduceat(breaks, starts)
+        streak[group] = np.where(last_break >= starts, ends - last_break, ends - starts + 1)
+
+    shape = (n_users, n_skills)
+    return MasteryMatrix(
+        user_ids=list(user_ids),
+        skill_ids=skill_ids,
+        score_sum=score_sum.reshape(shape),
+        attempts=attempts.reshape(shape),
+        last_correct_us=last_correct.reshape(shape),
+        streak=streak.reshape(shape),
+    )
+
+
+def class_mastery(graph: GraphSnapshot, user_ids: list[str]) -> MasteryMatrix:
+    return compute_mastery_matrix(fetch_attempt_rows(user_ids), graph, user_ids)
+
+
+def matrix_summary(matrix: MasteryMatrix) -> dict:
+    """JSON view for admin class tooling: dense level/attempt rows plus per-skill/per-student rollups."""
+    level = matrix.level
+    attempted = matrix.attempts > 0
+    per_skill = np.divide(
+        (level * attempted).sum(axis=0), attempted.sum(axis=0),
+        out=np.zeros(level.shape[1]), where=attempted.any(axis=0),
+    )
+    return {
+        "user_ids": matrix.user_ids,
+        "skill_ids": matrix.skill_ids,
+        "level": np.round(level, 2).tolist(),
+        "attempts": matrix.attempts.tolist(),
+        "skill_average": np.round(per_skill, 2).tolist(),
+        "mastered_count": (level >= MASTERY_THRESHOLD).sum(axis=1).tolist(),
+        "due_reviews": matrix.due_counts().tolist(),
+    }
+
+
+def recommend_for_students(
+    driver: Driver,
+    graph: GraphSnapshot,
+    user_ids: list[str],
+    target_skill_id: Optional[str] = None,
+    distinct: bool = True,
+) -> dict[str, Optional[dict]]:
+    """One recommended task per student: bulk attempt/lock reads, one snapshot, one hydration query.
+
+    With distinct, a task handed to one student is avoided for the following ones
+    while they still have other candidates, so neighbours get different tasks.
+    """
+    rows = fetch_attempt_rows(user_ids)
+    locked = fetch_locked_skills(user_ids)
+    matrix = compute_mastery_matrix(rows, graph, user_ids)
+
+    newest_first: dict[str, list[dict]] = {uid: [] for uid in user_ids}
+    for row in reversed(rows):
+        newest_first.setdefault(row["user_id"], []).append(row)
+
+    chosen: dict[str, Optional[str]] = {}
+    taken = 0
+    for uid in user_ids:
+        attempts = newest_first[uid]
+        zadanie_id = choose_task_id(
+            graph,
+            graph.ids_mask(a["zadanie_id"] for a in attempts),
+            matrix.for_user(uid),
+            recent_dzial_ids=recent_dzial_ids(graph, attempts),
+            target_skill_id=target_skill_id,
+            locked_skill_ids=locked.get(uid),
+            avoid=taken,
+        )
+        chosen[uid] = zadanie_id
+        if distinct and zadanie_id is not None:
+            taken |= graph.ids_mask([zadanie_id])
+
+    tasks = fetch_zadania_by_ids(driver, list({z for z in chosen.values() if z}))
+    return {uid: tasks.get(zid) if zid else None for uid, zid in chosen.items()}
@@ -0,0 +1,93 @@
+"""Minimal in-process histograms in Prometheus text format (no client library needed).
+
+    RENDER_STAGE = histogram("tikz_render_stage_seconds", "...", "stage")
+    with RENDER_STAGE.time("latex"):
+        ...
+
+GET /api/metrics renders every registered histogram (and collector) for scraping.
+"""
+
+from __future__ import annotations
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable
+
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+)
+
+
+class Histogram:
+    """Cumulative-bucket histogram keyed by a single label."""
+
+    def __init__(self, name: str, help_text: str, label: str, buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        # label value -> [per-bucket counts (+Inf last), count, sum]
+        self._series: dict[str, list] = {}
+
+    def observe(self, label_value: str, seconds: float) -> None:
+        idx = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            series = self._series.get(label_value)
+            if series is None:
+                series = self._series[label_value] = [[0] * (len(self.buckets) + 1), 0, 0.0]
+            series[0][idx] += 1
+            series[1] += 1
+            series[2] += seconds
+
+    @contextmanager
+    def time(self, label_value: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(label_value, time.perf_counter() - start)
+
+    def snapshot(self) -> dict[str, tuple[int, float]]:
+        """{label value: (count, sum of seconds)}."""
+        with self._lock:
+            return {k: (v[1], v[2]) for k, v in self._series.items()}
+
+    def reset(self) -> None:
+        with self._lock:
+            self._series.clear()
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for value, (counts, count, total) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, n in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += n
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f'{self.name}_bucket{{{self.label}="{value}",le="{le}"}} {cumulative}')
+                lines.append(f'{self.name}_count{{{self.label}="{value}"}} {count}')
+                lines.append(f'{self.name}_sum{{{self.label}="{value}"}} {total:.6f}')
+        return "\n".join(lines)
+
+
+_registry: list[Histogram] = []
+_collectors: list[Callable[[], str]] = []
+
+
+def histogram(name: str, help_text: str, label: str, buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+    h = Histogram(name, help_text, label, buckets)
+    _registry.append(h)
+    return h
+
+
+def register_collector(collect: Callable[[], str]) -> None:
+    """Add a callable returning extra exposition lines (counters/gauges) at scrape time."""
+    _collectors.append(collect)
+
+
+def render_metrics() -> str:
+    parts = [h.render() for h in _registry] + [collect() for collect in _collectors]
+    return "\n".join(parts) + "\n"
@@ -1,14 +1,29 @@
 """Neo4j graph database client and FastAPI dependency."""
+import logging
 import os
 from contextlib import asynccontextmanager
 from typing import Optional
 
-from neo4j import GraphDatabase, Driver
+from neo4j import AsyncDriver, AsyncGraphDatabase, GraphDatabase, Driver
 from dotenv import load_dotenv
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 _driver: Optional[Driver] = None
+# Endpoints query through the async driver so a graph round trip does not block the
+# event loop; the sync driver stays for the graph snapshot loader, prerender and CLIs.
+_async_driver: Optional[AsyncDriver] = None
+
+# Every hot lookup matches these nodes by id; a uniqueness constraint also backs them
+# with a range index. IF NOT EXISTS keeps the bootstrap idempotent (Neo4j 5 syntax).
+SCHEMA_CONSTRAINTS = {
+    "zadanie_id_unique": "Zadanie",
+    "dzial_id_unique": "Dzial",
+    "umiejetnosc_id_unique": "Umiejetnosc",
+}
+LABEL_SCAN_OPERATORS = ("AllNodesScan", "NodeByLabelScan")
 
 
 def get_neo4j_uri() -> str:
@@ -30,6 +45,14 @@ def get_neo4j_auth() -> tuple[str, str]:
     return ("neo4j", auth)
 
 
+def _pool_config() -> dict:
+    """Connection pool settings shared by both drivers (NEO4J_MAX_POOL_SIZE, NEO4J_ACQUISITION_TIMEOUT)."""
+    return {
+        "max_connection_pool_size": int(os.environ.get("NEO4J_MAX_POOL_SIZE", "100")),
+        "connection_acquisition_timeout": float(os.environ.get("NEO4J_ACQUISITION_TIMEOUT", "60")),
+    }
+
+
 def init_neo4j() -> Optional[Driver]:
     """Initialize Neo4j driver. Returns None if NEO4J_URI is not set (Neo4j disabled)."""
     global _driver
@@ -38,7 +61,7 @@ def init_neo4j() -> Optional[Driver]:
     uri = get_neo4j_uri()
     user, password = get_neo4j_auth()
     try:
-        _driver = GraphDatabase.driver(uri, auth=(user, password))
+        _driver = GraphDatabase.driver(uri, auth=(user, password), **_pool_config())
         _driver.verify_connectivity()
         return _driver
     except Exception:
@@ -48,6 +71,84 @@ def init_neo4j() -> Optional[Driver]:
         return None
 
 
+async def init_neo4j_async() -> Optional[AsyncDriver]:
+    """Initialize the async Neo4j driver. Returns None if Neo4j is disabled or unreachable."""
+    global _async_driver
+    if not os.environ.get("NEO4J_URI") and not os.environ.get("NEO4J_AUTH"):
+        return None
+    uri = get_neo4j_uri()
+    user, password = get_neo4j_auth()
+    try:
+        _async_driver = AsyncGraphDatabase.driver(uri, auth=(user, password), **_pool_config())
+        await _async_driver.verify_connectivity()
+        return _async_driver
+    except Exception:
+        if _async_driver:
+            await _async_driver.close()
+        _async_driver = None
+        return None
+
+
+def _plan_operators(plan) -> list[str]:
+    """Operator names of an EXPLAIN plan tree, without the "@neo4j" runtime suffix."""
+    if not plan:
+        return []
+    ops = [plan.get("operatorType", "").split("@")[0]]
+    for child in plan.get("children", []):
+        ops.extend(_plan_operators(child))
+    return ops
+
+
+def check_query_plans(driver: Driver, queries: dict[str, tuple[str, dict]]) -> dict[str, list[str]]:
+    """EXPLAIN each named (query, params) pair; warn when one falls back to a label scan.
+
+    Returns {name: scan operators found}. EXPLAIN only plans the query, nothing runs.
+    """
+    scans: dict[str, list[str]] = {}
+    with driver.session() as session:
+        for name, (query, params) in queries.items():
+            try:
+                plan = session.run("EXPLAIN " + query, **params).consume().plan
+            except Exception as e:
+                logger.warning("Could not EXPLAIN %s: %s", name, e)
+                continue
+            found = [op for op in _plan_operators(plan) if op in LABEL_SCAN_OPERATORS]
+            if found:
+                scans[name] = found
+                logger.warning("Neo4j query %s uses %s instead of an index lookup", name, ", ".join(found))
+    return scans
+
+
+def ensure_schema(driver: Optional[Driver], plan_checks: Optional[dict[str, tuple[str, dict]]] = None) -> None:
+    """Create the id uniqueness constraints if missing, then check the given query plans.
+
+    Safe to run on every startup. A constraint that cannot be created (e.g. duplicate ids
+    in imported data) is logged and falls back to a plain range index on the same property.
+    """
+    if not driver:
+        return
+    with driver.session() as session:
+        for name, label in SCHEMA_CONSTRAINTS.items():
+            try:
+                session.run(
+                    f"CREATE CONSTRAINT {name} IF NOT EXISTS FOR (n:{label}) REQUIRE n.id IS UNIQUE"
+                ).consume()
+            except Exception as e:
+                logger.warning("Could not create constraint %s, creating a plain index: %s", name, e)
+                try:
+                    session.run(
+                        f"CREATE INDEX {label.lower()}_id IF NOT EXISTS FOR (n:{label}) ON (n.id)"
+                    ).consume()
+                except Exception as e:
+                    logger.warning("Could not create index on %s.id: %s", label, e)
+        try:
+            session.run("CALL db.awaitIndexes(60)").consume()
+        except Exception as e:
+            logger.warning("Indexes still populating: %s", e)
+    if plan_checks:
+        check_query_plans(driver, plan_checks)
+
+
 def close_neo4j() -> None:
     """Close Neo4j driver."""
     global _driver
@@ -56,15 +157,28 @@ def close_neo4j() -> None:
         _driver = None
 
 
+async def close_neo4j_async() -> None:
+    """Close the async Neo4j driver."""
+    global _async_driver
+    if _async_driver:
+        await _async_driver.close()
+        _async_driver = None
+
+
 def get_neo4j() -> Optional[Driver]:
     """Return the Neo4j driver. Use as FastAPI Depends(get_neo4j)."""
     return _driver
 
 
+def get_neo4j_async() -> Optional[AsyncDriver]:
+    """Return the async Neo4j driver. Use as FastAPI Depends(get_neo4j_async)."""
+    return _async_driver
+
+
 @asynccontextmanager
 async def neo4j_session():
-    """Async context manager for a Neo4j session (for use in endpoints)."""
-    if not _driver:
+    """Async context manager for an async Neo4j session (for use in endpoints)."""
+    if not _async_driver:
         raise RuntimeError("Neo4j driver not initialized")
-    with _driver.session() as session:
+    async with _async_driver.session() as session:
         yield session
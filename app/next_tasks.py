@@ -0,0 +1,89 @@
+"""Per-student queue of precomputed, fully hydrated "next" recommended tasks.
+
+Right after /tasks/check stores an attempt, the next few recommendations for that
+student are computed in the background, so the following /tasks/recommended call
+is a queue pop instead of the whole pipeline plus a Neo4j round trip.
+
+The queues live in this process (the app runs a single uvicorn worker). Entries are
+tagged with the graph snapshot version they were computed against and are ignored
+after a graph reload. Admin lock/unlock calls invalidate(); a per-student generation
+counter stops a fill that started before an invalidation from publishing stale tasks.
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+from collections import OrderedDict, deque
+from typing import Optional
+
+from .metrics import register_collector
+
+NEXT_TASKS_DEPTH = int(os.environ.get("NEXT_TASKS_DEPTH", "3"))  # 0 disables prefetching
+NEXT_TASKS_MAX_STUDENTS = int(os.environ.get("NEXT_TASKS_MAX_STUDENTS", "2000"))
+
+
+class NextTaskQueues:
+    def __init__(self, max_students: int = NEXT_TASKS_MAX_STUDENTS):
+        self.max_students = max_students
+        self._lock = threading.Lock()
+        self._queues: OrderedDict[str, tuple[str, deque]] = OrderedDict()
+        self._generations: dict[str, int] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def generation(self, user_id: str) -> int:
+        with self._lock:
+            return self._generations.get(user_id, 0)
+
+    def invalidate(self, user_id: str) -> None:
+        with self._lock:
+            self._queues.pop(user_id, None)
+            self._generations[user_id] = self._generations.get(user_id, 0) + 1
+
+    def put(self, user_id: str, generation: int, graph_version: str, tasks: list[dict]) -> bool:
+        """Publish a fill unless the student was invalidated since `generation` was read."""
+        with self._lock:
+            if self._generations.get(user_id, 0) != generation:
+                return False
+            self._queues[user_id] = (graph_version, deque(tasks))
+            self._queues.move_to_end(user_id)
+            while len(self._queues) > self.max_students:
+                evicted, _ = self._queues.popitem(last=False)
+                self._generations.pop(evicted, None)
+            return True
+
+    def pop(self, user_id: str, graph_version: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._queues.get(user_id)
+            if entry is None or entry[0] != graph_version or not entry[1]:
+                self._queues.pop(user_id, None)
+                self.misses += 1
+                return None
+            task = entry[1].popleft()
+            if not entry[1]:
+                del self._queues[user_id]
+            self.hits += 1
+            return task
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"students": len(self._queues), "hits": self.hits, "misses": self.misses}
+
+
+next_task_queues = NextTaskQueues()
+
+
+def _collect_metrics() -> str:
+    stats = next_task_queues.stats()
+    lines = [
+        "# TYPE next_tasks_queue_students gauge",
+        f"next_tasks_queue_students {stats['students']}",
+        "# TYPE next_tasks_queue_pops_total counter",
+        f'next_tasks_queue_pops_total{{result="hit"}} {stats["hits"]}',
+        f'next_tasks_queue_pops_total{{result="miss"}} {stats["misses"]}',
+    ]
+    return "\n".join(lines)
+
+
+register_collector(_collect_metrics)
@@ -0,0 +1,149 @@
+"""Pre-render every task diagram from the Neo4j graph into the TikZ cache.
+
+Walks all Zadanie nodes page by page, prepares each `tikz` exactly the way
+the browser request would be, and renders the ones whose content hash is not
+cached yet. Re-runs are therefore incremental. Renders go through the shared
+render pool (TIKZ_RENDER_CONCURRENCY workers) with a bounded backlog, so a run
+started from the API leaves workers free for diagrams requested by students.
+From the command line, --workers sizes this process's pool instead.
+
+    python -m app.prerender [--workers N] [--page-size 500]
+
+Also triggered from the admin API (POST /admin/tikz/prerender).
+"""
+
+from __future__ import annotations
+
+import argparse
+import logging
+import threading
+from concurrent.futures import FIRST_COMPLETED, Future, as_completed, wait
+from typing import Optional
+
+from neo4j import Driver
+
+from .ai import fix_latex_json_corruption
+from .skill_engine import fetch_all_tasks
+from .tikz import (
+    TikzRenderError,
+    get_render_queue,
+    get_tikz_cache,
+    prepare_tikz,
+    render_svg,
+    resize_render_queue,
+    tikz_key,
+)
+
+logger = logging.getLogger(__name__)
+
+_run_lock = threading.Lock()
+
+
+def _collect_pending(driver: Driver, page_size: int, stats: dict) -> dict[str, str]:
+    """Return {key: prepared tikz} for diagrams that are not in the cache yet."""
+    cache = get_tikz_cache()
+    pending: dict[str, str] = {}
+    seen: set[str] = set()
+    after = None
+    while True:
+        page = fetch_all_tasks(driver, limit=page_size, after=after, fields=("id", "tikz"))
+        stats["tasks"] += len(page)
+        for task in page:
+            raw = task.get("tikz") or ""
+            # Same transformations as GET /tasks/* (fix_latex_in_structure) + POST /api/tikz-svg
+            tikz = prepare_tikz(fix_latex_json_corruption(raw))
+            if not tikz.strip():
+                continue
+            key = tikz_key(tikz)
+            if key in seen:
+                continue
+            seen.add(key)
+            stats["diagrams"] += 1
+            if key in cache:
+                stats["skipped"] += 1
+            else:
+                pending[key] = tikz
+        if len(page) < page_size:
+            return pending
+        after = page[-1]["id"]
+
+
+def _render_one(key: str, tikz: str) -> bool:
+    """Render and store one diagram; False if a request rendered it in the meantime."""
+    cache = get_tikz_cache()
+    if key in cache:
+        return False
+    cache.put(key, render_svg(tikz))
+    return True
+
+
+def _record(future: Future, key: str, stats: dict) -> None:
+    try:
+        stats["rendered" if future.result() else "skipped"] += 1
+    except Exception as e:
+        stats["failed"] += 1
+        detail = e.detail if isinstance(e, TikzRenderError) else str(e)
+        logger.warning("prerender: %s failed: %s", key[:12], detail[-200:])
+
+
+def prerender_all(driver: Driver, workers: Optional[int] = None, page_size: int = 500) -> Optional[dict]:
+    """Render all uncached task diagrams on the shared render pool. Returns None if a run is already active.
+
+    At most `workers` renders are outstanding at once (default: half the pool); the
+    pool size caps how many of them actually run in parallel.
+    """
+    if not _run_lock.acquire(blocking=False):
+        return None
+    try:
+        stats = {"tasks": 0, "diagrams": 0, "skipped": 0, "rendered": 0, "failed": 0}
+        pending = _collect_pending(driver, page_size, stats)
+
+        queue = get_render_queue()
+        limit = workers or max(1, queue.concurrency // 2)
+        running: dict[Future, str] = {}
+        for key, tikz in pending.items():
+            if len(running) >= limit:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    _record(future, running.pop(future), stats)
+            running[queue.submit(_render_one, key, tikz)] = key
+        for future in as_completed(running):
+            _record(future, running[future], stats)
+
+        logger.info("prerender: %s", stats)
+        return stats
+    finally:
+        _run_lock.release()
+
+
+def is_running() -> bool:
+    return _run_lock.locked()
+
+
+def main() -> None:
+    from .neo4j import close_neo4j, init_neo4j
+    from .tikz import build_tikz_format
+
+    parser = argparse.ArgumentParser(description="Pre-render all task TikZ diagrams into the SVG cache.")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="parallel renders; sizes the render pool (default: TIKZ_RENDER_CONCURRENCY)")
+    parser.add_argument("--page-size", type=int, default=500, help="tasks fetched per Neo4j page")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    driver = init_neo4j()
+    if not driver:
+        raise SystemExit("Neo4j not available (check NEO4J_URI / NEO4J_AUTH)")
+    try:
+        build_tikz_format()
+        if args.workers:
+            resize_render_queue(args.workers)
+        workers = get_render_queue().concurrency
+        stats = prerender_all(driver, workers=workers, page_size=args.page_size)
+        print(stats)
+    finally:
+        close_neo4j()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,24 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, status
 from ..dependencies import require_admin
 from ..services import get_admin_supabase
 from ..ai import fix_latex_in_structure
-from ..schemas import CreateUserRequest, UpdateLessonRequest, UpdateStudentRequest, LockSkillRequest
+from ..attempts import fetch_attempts
+from ..schemas import (
+    CreateUserRequest,
+    UpdateLessonRequest,
+    UpdateStudentRequest,
+    LockSkillRequest,
+    StudentBatchRequest,
+    ClassRecommendationRequest,
+)
 from ..skill_engine import fetch_skill_map
+from ..mastery import count_due_reviews, load_mastery, rebuild_user_mastery
+from ..mastery_batch import class_mastery, matrix_summary, recommend_for_students
+from ..next_tasks import next_task_queues
 from ..neo4j import get_neo4j
+from ..prerender import is_running as prerender_running, prerender_all
+from ..skill_graph import get_graph_snapshot, refresh_graph_snapshot
+import asyncio
 import os
 
 EMAIL_DOMAIN = os.environ.get("USER_EMAIL_DOMAIN", "zrozum-to.pl")
@@ -193,18 +207,6 @@ async def get_student_progress(student_id: str, admin = Depends(require_admin)):
         raise HTTPException(status_code=400, detail=str(e))
 
 
-def _get_student_attempts(user_id: str) -> list:
-    supabase = get_admin_supabase()
-    res = (
-        supabase.table("task_attempts")
-        .select("*")
-        .eq("user_id", user_id)
-        .order("created_at", desc=True)
-        .execute()
-    )
-    return res.data or []
-
-
 def _get_locked_skill_ids(user_id: str) -> set:
     supabase = get_admin_supabase()
     try:
@@ -219,15 +221,80 @@ def _get_locked_skill_ids(user_id: str) -> set:
         return set()
 
 
+@router.post("/students/mastery")
+def get_class_mastery(req: StudentBatchRequest, admin=Depends(require_admin)):
+    """Student × skill mastery matrix for a group of students, computed in one batch."""
+    driver = get_neo4j()
+    if not driver:
+        raise HTTPException(status_code=503, detail="Neo4j not available")
+    user_ids = list(dict.fromkeys(req.user_ids))
+    try:
+        matrix = class_mastery(get_graph_snapshot(driver), user_ids)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return matrix_summary(matrix)
+
+
+@router.post("/students/reviews/due")
+def get_due_review_counts(req: StudentBatchRequest, admin=Depends(require_admin)):
+    """Number of skills due for spaced-repetition review per student (dashboard badge)."""
+    user_ids = list(dict.fromkeys(req.user_ids))
+    counts = count_due_reviews(user_ids) or {}
+    missing = [uid for uid in user_ids if uid not in counts]
+    if missing:
+        # No stored records (table unavailable or students not backfilled yet)
+        driver = get_neo4j()
+        if not driver:
+            raise HTTPException(status_code=503, detail="Neo4j not available")
+        matrix = class_mastery(get_graph_snapshot(driver), missing)
+        counts.update(zip(matrix.user_ids, matrix.due_counts().tolist()))
+    return {"counts": {uid: counts[uid] for uid in user_ids}}
+
+
+@router.post("/students/recommendations")
+def get_class_recommendations(req: ClassRecommendationRequest, admin=Depends(require_admin)):
+    """One recommended task per student (e.g. to start a class session), assigned in one pass."""
+    driver = get_neo4j()
+    if not driver:
+        raise HTTPException(status_code=503, detail="Neo4j not available")
+    user_ids = list(dict.fromkeys(req.user_ids))
+    try:
+        tasks = recommend_for_students(
+            driver,
+            get_graph_snapshot(driver),
+            user_ids,
+            target_skill_id=req.skill_id,
+            distinct=req.distinct,
+        )
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"tasks": fix_latex_in_structure(tasks)}
+
+
 @router.get("/students/{user_id}/skill-map")
-async def get_student_skill_map(user_id: str, admin=Depends(require_admin)):
-    """Return full skill map for a student (for admin lock/unlock UI)."""
+def get_student_skill_map(user_id: str, admin=Depends(require_admin)):
+    """Return a student's skill map overlay (for admin lock/unlock UI; graph: GET /tasks/skill-graph)."""
     driver = get_neo4j()
     if not driver:
         raise HTTPException(status_code=503, detail="Neo4j not available")
-    attempts = _get_student_attempts(user_id)
+    mastery = load_mastery(user_id)
+    attempts = [] if mastery is not None else fetch_attempts(user_id)
     locked = _get_locked_skill_ids(user_id)
-    return fetch_skill_map(driver, attempts, locked_skill_ids=locked)
+    return fetch_skill_map(get_graph_snapshot(driver), attempts, locked_skill_ids=locked, mastery=mastery)
+
+
+@router.post("/students/{user_id}/mastery/rebuild")
+def rebuild_student_mastery(user_id: str, admin=Depends(require_admin)):
+    """Recompute a student's stored skill mastery from their full attempt history."""
+    driver = get_neo4j()
+    if not driver:
+        raise HTTPException(status_code=503, detail="Neo4j not available")
+    try:
+        skills = rebuild_user_mastery(user_id, get_graph_snapshot(driver).zadanie_skill_map)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    next_task_queues.invalidate(user_id)
+    return {"status": "success", "skill_records": skills}
 
 
 @router.get("/students/{user_id}/locked-skills")
@@ -263,6 +330,7 @@ async def lock_skill(
             },
             on_conflict="user_id,skill_id",
         ).execute()
+        next_task_queues.invalidate(user_id)
         return {"status": "success", "skill_id": req.skill_id}
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -284,11 +352,37 @@ async def unlock_skill(
             .eq("skill_id", skill_id)
             .execute()
         )
+        next_task_queues.invalidate(user_id)
         return {"status": "success", "skill_id": skill_id}
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 
+@router.post("/tikz/prerender")
+async def prerender_diagrams(background_tasks: BackgroundTasks, admin=Depends(require_admin)):
+    """Render all task diagrams into the SVG cache in the background (skips cached ones)."""
+    driver = get_neo4j()
+    if not driver:
+        raise HTTPException(status_code=503, detail="Neo4j not available")
+    if prerender_running():
+        raise HTTPException(status_code=409, detail="Pre-render already running")
+    background_tasks.add_task(prerender_all, driver)
+    return {"status": "started"}
+
+
+@router.post("/graph/refresh")
+async def refresh_skill_graph(admin=Depends(require_admin)):
+    """Reload the in-memory skill graph snapshot (call after importing content into Neo4j)."""
+    driver = get_neo4j()
+    if not driver:
+        raise HTTPException(status_code=503, detail="Neo4j not available")
+    try:
+        snapshot = await asyncio.to_thread(refresh_graph_snapshot, driver)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Graph refresh failed: {str(e)}")
+    return snapshot.summary()
+
+
 @router.delete("/quizzes/{quiz_id}")
 async def delete_quiz(quiz_id: str, admin = Depends(require_admin)):
     supabase = get_admin_supabase()
@@ -4,61 +4,63 @@ Fetches tasks from Neo4j, checks answers via Gemini AI,
 and manages the skill-based recommendation engine.
 """
 
-from fastapi import APIRouter, Depends, HTTPException, Query
+import asyncio
+import logging
+
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, Request
+from fastapi.responses import Response
 from typing import Optional
 
 from ..ai import fix_latex_in_structure
+from ..attempts import fetch_attempted_task_ids, fetch_attempts
 from ..dependencies import get_current_user
-from ..neo4j import get_neo4j
+from ..mastery import load_due_reviews, load_mastery, record_attempt
+from ..neo4j import get_neo4j, get_neo4j_async
+from ..next_tasks import NEXT_TASKS_DEPTH, next_task_queues
 from ..services import get_admin_supabase
+from ..skill_graph import get_graph_snapshot_async
 from ..schemas import TaskCheckRequest, TaskHintRequest, TaskWorkedExampleRequest
 from ..skill_engine import (
-    fetch_dzialy,
-    fetch_tasks_by_dzial,
-    fetch_all_tasks,
-    fetch_random_task,
+    choose_task_id,
+    compute_skill_mastery,
+    fetch_all_tasks_async,
+    fetch_dzialy_async,
+    fetch_random_task_async,
     fetch_skill_map,
-    recommend_task,
-    _fetch_zadanie_by_id,
+    fetch_tasks_by_dzial_async,
+    fetch_zadania_by_ids_async,
+    fetch_zadanie_by_id_async,
+    get_skills_due_for_review,
+    parse_task_fields,
+    recent_dzial_ids,
+    recommend_task_async,
 )
 
+logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/tasks", tags=["tasks"])
 
 
 def _require_neo4j():
-    driver = get_neo4j()
+    """Async driver for queries made by the endpoints."""
+    driver = get_neo4j_async()
     if not driver:
         raise HTTPException(status_code=503, detail="Neo4j not available")
     return driver
 
 
-def _get_user_attempts(user_id: str) -> list[dict]:
-    supabase = get_admin_supabase()
-    res = (
-        supabase.table("task_attempts")
-        .select("*")
-        .eq("user_id", user_id)
-        .order("created_at", desc=True)
-        .execute()
-    )
-    return res.data or []
-
-
-def _get_recent_dzial_ids(attempts: list[dict], driver) -> list[int]:
-    """Extract dzial IDs from the student's most recent attempts."""
-    if not attempts:
-        return []
-    recent_zids = [a["zadanie_id"] for a in attempts[:5]]
-    with driver.session() as session:
-        result = session.run(
-            """
-            MATCH (z:Zadanie)-[:SPRAWDZA]->(u:Umiejetnosc)<-[:ZAWIERA]-(d:Dzial)
-            WHERE z.id IN $zids
-            RETURN DISTINCT d.id AS did
-            """,
-            zids=recent_zids,
-        )
-        return [r["did"] for r in result]
+async def _graph_snapshot():
+    """Current skill graph snapshot (its loader uses the sync driver)."""
+    driver = get_neo4j()
+    if not driver:
+        raise HTTPException(status_code=503, detail="Neo4j not available")
+    return await get_graph_snapshot_async(driver)
+
+
+def _task_fields(fields: Optional[str]) -> tuple[str, ...]:
+    try:
+        return parse_task_fields(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 
 def _get_locked_skill_ids(user_id: str) -> set[str]:
@@ -76,21 +78,103 @@ def _get_locked_skill_ids(user_id: str) -> set[str]:
         return set()
 
 
+async def _load_student_state(user_id: str, with_attempts: bool = True):
+    """(attempts, locked skill ids, stored mastery) with the Supabase reads running concurrently."""
+    reads = [
+        asyncio.to_thread(_get_locked_skill_ids, user_id),
+        asyncio.to_thread(load_mastery, user_id),
+    ]
+    if with_attempts:
+        reads.append(asyncio.to_thread(fetch_attempts, user_id))
+    locked, mastery, *rest = await asyncio.gather(*reads)
+    return (rest[0] if rest else None), locked, mastery
+
+
+def _choose_next_task_ids(graph, attempts: list[dict], locked: set[str], mastery) -> list[str]:
+    if mastery is None:
+        mastery = compute_skill_mastery(attempts, graph.zadanie_skill_map)
+    recent = recent_dzial_ids(graph, attempts)
+    attempted = graph.ids_mask(a["zadanie_id"] for a in attempts)
+
+    chosen: list[str] = []
+    taken = 0
+    for _ in range(NEXT_TASKS_DEPTH):
+        zadanie_id = choose_task_id(
+            graph, attempted, mastery, recent_dzial_ids=recent, locked_skill_ids=locked, avoid=taken
+        )
+        if zadanie_id is None or zadanie_id in chosen:
+            break
+        chosen.append(zadanie_id)
+        taken |= graph.ids_mask([zadanie_id])
+    return chosen
+
+
+async def _prefill_next_tasks(driver, graph, user_id: str) -> None:
+    """Compute and hydrate the student's next NEXT_TASKS_DEPTH recommendations (background task).
+
+    Runs after the response is sent, so failures are only logged; /tasks/recommended
+    then computes the next task on request.
+    """
+    generation = next_task_queues.generation(user_id)
+    try:
+        attempts, locked, mastery = await _load_student_state(user_id)
+        chosen = await asyncio.to_thread(_choose_next_task_ids, graph, attempts, locked, mastery)
+        tasks = await fetch_zadania_by_ids_async(driver, chosen)
+    except Exception as e:
+        logger.warning("next tasks prefill failed for %s: %s", user_id, e)
+        return
+    next_task_queues.put(user_id, generation, graph.version, [tasks[z] for z in chosen if z in tasks])
+
+
 # --- Endpoints ---
 
 
 @router.get("/dzialy")
 async def list_dzialy(user=Depends(get_current_user)):
     driver = _require_neo4j()
-    return fetch_dzialy(driver)
+    return await fetch_dzialy_async(driver)
+
+
+# Revalidated on every use, but an unchanged graph costs only a 304
+SKILL_GRAPH_CACHE_CONTROL = "private, no-cache"
+
+
+@router.get("/skill-graph")
+async def get_skill_graph(request: Request, user=Depends(get_current_user)):
+    """Static skill map structure (dzialy, skills, WYMAGA edges), ETag-versioned by the graph snapshot."""
+    graph = await _graph_snapshot()
+    headers = {"ETag": f'"{graph.version}"', "Cache-Control": SKILL_GRAPH_CACHE_CONTROL}
+    if_none_match = request.headers.get("if-none-match", "")
+    tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    if headers["ETag"] in tags or "*" in tags:
+        return Response(status_code=304, headers=headers)
+    return Response(content=graph.skill_graph_json, media_type="application/json", headers=headers)
 
 
 @router.get("/skill-map")
 async def get_skill_map(user=Depends(get_current_user)):
-    driver = _require_neo4j()
-    attempts = _get_user_attempts(str(user.id))
-    locked = _get_locked_skill_ids(str(user.id))
-    return fetch_skill_map(driver, attempts, locked_skill_ids=locked)
+    graph = await _graph_snapshot()
+    _, locked, mastery = await _load_student_state(str(user.id), with_attempts=False)
+    attempts = [] if mastery is not None else await asyncio.to_thread(fetch_attempts, str(user.id))
+    return fetch_skill_map(graph, attempts, locked_skill_ids=locked, mastery=mastery)
+
+
+@router.get("/reviews/due")
+async def get_due_reviews(user=Depends(get_current_user)):
+    """Skills due for spaced-repetition review now, most overdue first."""
+    due, locked = await asyncio.gather(
+        asyncio.to_thread(load_due_reviews, str(user.id)),
+        asyncio.to_thread(_get_locked_skill_ids, str(user.id)),
+    )
+    if due is None:
+        attempts = await asyncio.to_thread(fetch_attempts, str(user.id))
+        mastery = compute_skill_mastery(attempts, (await _graph_snapshot()).zadanie_skill_map)
+        due = [
+            {"skill_id": sid, "next_due_at": mastery[sid]["next_due_at"].isoformat()}
+            for sid in get_skills_due_for_review(mastery)
+        ]
+    skills = [d for d in due if d["skill_id"] not in locked]
+    return {"count": len(skills), "skills": skills}
 
 
 @router.get("/recommended")
@@ -99,17 +183,23 @@ async def get_recommended_task(
     user=Depends(get_current_user),
 ):
     driver = _require_neo4j()
-    attempts = _get_user_attempts(str(user.id))
-    recent_dzialy = _get_recent_dzial_ids(attempts, driver)
-    locked = _get_locked_skill_ids(str(user.id))
-
-    task = recommend_task(
+    graph = await _graph_snapshot()
+    if skill_id is None:
+        queued = next_task_queues.pop(str(user.id), graph.version)
+        if queued:
+            return fix_latex_in_structure(queued)
+
+    # Supabase reads run concurrently; the graph side is the in-memory snapshot plus
+    # one Neo4j query for the chosen task.
+    attempts, locked, mastery = await _load_student_state(str(user.id))
+    task = await recommend_task_async(
         driver=driver,
-        user_id=str(user.id),
+        graph=graph,
         attempts=attempts,
-        recent_dzial_ids=recent_dzialy,
+        recent_dzial_ids=recent_dzial_ids(graph, attempts),
         target_skill_id=skill_id,
         locked_skill_ids=locked,
+        mastery=mastery,
     )
     if not task:
         raise HTTPException(status_code=404, detail="No tasks available")
@@ -122,7 +212,9 @@ async def get_random_task(
     user=Depends(get_current_user),
 ):
     driver = _require_neo4j()
-    task = fetch_random_task(driver, dzial_id=dzial_id)
+    graph = await _graph_snapshot()
+    attempted = graph.ids_mask(await asyncio.to_thread(fetch_attempted_task_ids, str(user.id)))
+    task = await fetch_random_task_async(driver, graph, dzial_id, attempted)
     if not task:
         raise HTTPException(status_code=404, detail="No tasks found")
     return fix_latex_in_structure(task)
@@ -133,10 +225,14 @@ async def list_tasks_in_dzial(
     dzial_id: int,
     skip: int = Query(0, ge=0),
     limit: int = Query(20, ge=1, le=100),
+    after: Optional[str] = Query(None, description="last task id of the previous page"),
+    fields: Optional[str] = Query(None, description="comma-separated task fields, e.g. id,numer,typ"),
     user=Depends(get_current_user),
 ):
     driver = _require_neo4j()
-    tasks = fetch_tasks_by_dzial(driver, dzial_id, skip=skip, limit=limit)
+    tasks = await fetch_tasks_by_dzial_async(
+        driver, dzial_id, skip=skip, limit=limit, after=after, fields=_task_fields(fields)
+    )
     return fix_latex_in_structure(tasks)
 
 
@@ -144,29 +240,35 @@ async def list_tasks_in_dzial(
 async def list_all_tasks(
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=500),
+    after: Optional[str] = Query(None, description="last task id of the previous page"),
+    fields: Optional[str] = Query(None, description="comma-separated task fields, e.g. id,numer,typ"),
     user=Depends(get_current_user),
 ):
     """Temporary: list all tasks from Neo4j."""
     driver = _require_neo4j()
-    tasks = fetch_all_tasks(driver, skip=skip, limit=limit)
+    tasks = await fetch_all_tasks_async(driver, skip=skip, limit=limit, after=after, fields=_task_fields(fields))
     return fix_latex_in_structure(tasks)
 
 
 @router.get("/{zadanie_id}")
 async def get_task(zadanie_id: str, user=Depends(get_current_user)):
     driver = _require_neo4j()
-    task = _fetch_zadanie_by_id(driver, zadanie_id)
+    task = await fetch_zadanie_by_id_async(driver, zadanie_id)
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
     return fix_latex_in_structure(task)
 
 
 @router.post("/check")
-async def check_answer(req: TaskCheckRequest, user=Depends(get_current_user)):
+async def check_answer(
+    req: TaskCheckRequest,
+    background_tasks: BackgroundTasks,
+    user=Depends(get_current_user),
+):
     from ..ai import check_task_answer
 
     driver = _require_neo4j()
-    task = _fetch_zadanie_by_id(driver, req.zadanie_id)
+    task = await fetch_zadanie_by_id_async(driver, req.zadanie_id)
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
 
@@ -192,21 +294,39 @@ async def check_answer(req: TaskCheckRequest, user=Depends(get_current_user)):
         "image_submitted": req.image_base64 is not None and len(req.image_base64 or "") > 100,
     }
 
+    attempt = {
+        "user_id": str(user.id),
+        "zadanie_id": req.zadanie_id,
+        "is_correct": is_correct,
+        "answer_data": answer_data,
+        "ai_feedback": {
+            "poprawna_odpowiedz": result.get("poprawna_odpowiedz"),
+            "poprawne_rozumowanie": result.get("poprawne_rozumowanie"),
+            "uzasadnienie": result.get("uzasadnienie", ""),
+        },
+    }
     supabase = get_admin_supabase()
     try:
-        supabase.table("task_attempts").insert({
-            "user_id": str(user.id),
-            "zadanie_id": req.zadanie_id,
-            "is_correct": is_correct,
-            "answer_data": answer_data,
-            "ai_feedback": {
-                "poprawna_odpowiedz": result.get("poprawna_odpowiedz"),
-                "poprawne_rozumowanie": result.get("poprawne_rozumowanie"),
-                "uzasadnienie": result.get("uzasadnienie", ""),
-            },
-        }).execute()
+        saved = await asyncio.to_thread(supabase.table("task_attempts").insert(attempt).execute)
     except Exception as e:
         print(f"Warning: failed to save task_attempt: {e}")
+        return result
+
+    try:
+        zadanie_skill_map = (await _graph_snapshot()).zadanie_skill_map
+        await asyncio.to_thread(
+            record_attempt,
+            str(user.id),
+            zadanie_skill_map.get(req.zadanie_id, ()),
+            (saved.data or [attempt])[0],
+            zadanie_skill_map=zadanie_skill_map,
+        )
+    except Exception as e:
+        print(f"Warning: failed to update skill mastery: {e}")
+
+    next_task_queues.invalidate(str(user.id))
+    if NEXT_TASKS_DEPTH > 0:
+        background_tasks.add_task(_prefill_next_tasks, driver, await _graph_snapshot(), str(user.id))
 
     return result
 
@@ -216,7 +336,7 @@ async def get_hint(req: TaskHintRequest, user=Depends(get_current_user)):
     from ..ai import generate_task_hints_pair
 
     driver = _require_neo4j()
-    task = _fetch_zadanie_by_id(driver, req.zadanie_id)
+    task = await fetch_zadanie_by_id_async(driver, req.zadanie_id)
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
 
@@ -249,7 +369,7 @@ async def get_worked_example(req: TaskWorkedExampleRequest, user=Depends(get_cur
         pass
 
     driver = _require_neo4j()
-    task = _fetch_zadanie_by_id(driver, req.zadanie_id)
+    task = await fetch_zadanie_by_id_async(driver, req.zadanie_id)
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
 
@@ -87,3 +87,17 @@ class TaskWorkedExampleRequest(BaseModel):
 
 class LockSkillRequest(BaseModel):
     skill_id: str
+
+
+class TikzBatchRequest(BaseModel):
+    items: List[str] = Field(..., min_length=1, max_length=50)  # base64 TikZ, like /api/tikz-svg {t}
+
+
+class StudentBatchRequest(BaseModel):
+    user_ids: List[str] = Field(..., min_length=1, max_length=500)
+
+
+class ClassRecommendationRequest(BaseModel):
+    user_ids: List[str] = Field(..., min_length=1, max_length=100)
+    skill_id: Optional[str] = None
+    distinct: bool = True  # avoid giving two students the same task while alternatives exist
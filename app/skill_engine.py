@@ -6,11 +6,14 @@ to recommend the best next task for a student.
 
 from __future__ import annotations
 
-import random
+import asyncio
 from datetime import datetime, timedelta, timezone
-from typing import Optional
+from typing import TYPE_CHECKING, Optional
 
-from neo4j import Driver
+from neo4j import AsyncDriver, Driver
+
+if TYPE_CHECKING:
+    from .skill_graph import GraphSnapshot
 
 MASTERY_THRESHOLD = 0.7
 SPACED_INTERVALS_DAYS = [1, 3, 7, 14]
@@ -24,99 +27,146 @@ MASTERY_WEIGHTS = {
 
 
 def _compute_attempt_score(attempt: dict) -> float:
-    """Compute a mastery score for a single attempt."""
-    ai = attempt.get("ai_feedback") or {}
-    answer_data = attempt.get("answer_data") or {}
+    """Compute a mastery score for a single attempt.
+
+    Accepts full task_attempts rows and rows with the projected reasoning / hints_used
+    columns (app/attempts.py).
+    """
     is_correct = attempt.get("is_correct", False)
 
     if not is_correct:
         return MASTERY_WEIGHTS["incorrect"]
 
-    reasoning = ai.get("poprawne_rozumowanie")
+    if "reasoning" in attempt:
+        reasoning = attempt["reasoning"]
+    else:
+        reasoning = (attempt.get("ai_feedback") or {}).get("poprawne_rozumowanie")
     if reasoning is True:
         return MASTERY_WEIGHTS["answer_and_reasoning"]
     elif reasoning is False:
         return MASTERY_WEIGHTS["answer_correct_reasoning_wrong"]
     else:
-        hints_used = answer_data.get("hints_used", 0)
+        if "hints_used" in attempt:
+            hints_used = attempt["hints_used"] or 0
+        else:
+            hints_used = (attempt.get("answer_data") or {}).get("hints_used", 0)
         base = MASTERY_WEIGHTS["answer_only_correct"]
         return max(0.1, base - hints_used * 0.15)
 
 
+def _parse_created(value) -> datetime | None:
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+    if isinstance(value, datetime) and value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value if isinstance(value, datetime) else None
+
+
+def new_skill_record() -> dict:
+    """Running per-skill aggregate; the same shape is stored in student_skill_mastery."""
+    return {"score_sum": 0.0, "attempts": 0, "last_correct_at": None, "streak": 0}
+
+
+def apply_attempt_score(record: dict, score: float, created: datetime | None) -> None:
+    """Fold one attempt (in chronological order) into a skill record, in place."""
+    record["score_sum"] += score
+    record["attempts"] += 1
+    if score > 0 and created is not None:
+        last = record["last_correct_at"]
+        if last is None or created > last:
+            record["last_correct_at"] = created
+    if score >= MASTERY_WEIGHTS["answer_only_correct"]:
+        record["streak"] += 1
+    else:
+        record["streak"] = 0
+
+
+def review_due_at(last_correct_at: datetime | None, streak: int) -> datetime | None:
+    """When a skill next comes up for spaced-repetition review (None if never answered correctly)."""
+    if last_correct_at is None:
+        return None
+    if last_correct_at.tzinfo is None:
+        last_correct_at = last_correct_at.replace(tzinfo=timezone.utc)
+    interval = SPACED_INTERVALS_DAYS[min(streak, len(SPACED_INTERVALS_DAYS) - 1)]
+    return last_correct_at + timedelta(days=interval)
+
+
+def mastery_from_record(record: dict) -> dict:
+    attempts = record["attempts"]
+    return {
+        "level": record["score_sum"] / attempts if attempts else 0.0,
+        "attempts": attempts,
+        "last_correct_at": record["last_correct_at"],
+        "interval_index": min(record["streak"], len(SPACED_INTERVALS_DAYS) - 1),
+        "next_due_at": review_due_at(record["last_correct_at"], record["streak"])
+        if record["score_sum"] > 0 else None,
+    }
+
+
+def fold_skill_records(
+    attempts: list[dict],
+    zadanie_skill_map: dict[str, tuple[str, ...]],
+) -> dict[str, dict]:
+    """Build {skill_id: skill record} from an attempt history (any order)."""
+    timed = [(_parse_created(att.get("created_at")), att) for att in attempts]
+    oldest = datetime.min.replace(tzinfo=timezone.utc)
+    timed.sort(key=lambda t: t[0] or oldest)
+
+    records: dict[str, dict] = {}
+    for created, att in timed:
+        score = _compute_attempt_score(att)
+        for sid in zadanie_skill_map.get(att.get("zadanie_id", ""), ()):
+            record = records.get(sid)
+            if record is None:
+                record = records[sid] = new_skill_record()
+            apply_attempt_score(record, score, created)
+    return records
+
+
 def compute_skill_mastery(
     attempts: list[dict],
-    zadanie_skill_map: dict[str, list[str]],
+    zadanie_skill_map: dict[str, tuple[str, ...]],
 ) -> dict[str, dict]:
     """Compute mastery per skill from attempt history.
 
+    The spaced-repetition interval follows the most recent run of correct answers.
+    Prefer the materialized per-skill records (app/mastery.py) on read paths; this
+    full recomputation is the fallback and the backfill.
+
     Returns {skill_id: {"level": float, "attempts": int, "last_correct_at": datetime|None,
                          "interval_index": int}}
     """
-    skill_scores: dict[str, list[tuple[float, datetime | None]]] = {}
-
-    for att in attempts:
-        zid = att.get("zadanie_id", "")
-        skills = zadanie_skill_map.get(zid, [])
-        score = _compute_attempt_score(att)
-        created = att.get("created_at")
-        if isinstance(created, str):
-            try:
-                created = datetime.fromisoformat(created.replace("Z", "+00:00"))
-            except ValueError:
-                created = None
-
-        for sid in skills:
-            skill_scores.setdefault(sid, []).append((score, created))
-
-    mastery: dict[str, dict] = {}
-    for sid, entries in skill_scores.items():
-        scores = [s for s, _ in entries]
-        avg = sum(scores) / len(scores) if scores else 0.0
-
-        correct_dates = [d for s, d in entries if s > 0 and d is not None]
-        last_correct = max(correct_dates) if correct_dates else None
-
-        consecutive_correct = 0
-        for s, _ in reversed(entries):
-            if s >= MASTERY_WEIGHTS["answer_only_correct"]:
-                consecutive_correct += 1
-            else:
-                break
-
-        interval_index = min(consecutive_correct, len(SPACED_INTERVALS_DAYS) - 1)
-
-        mastery[sid] = {
-            "level": avg,
-            "attempts": len(entries),
-            "last_correct_at": last_correct,
-            "interval_index": interval_index,
-        }
-
-    return mastery
+    records = fold_skill_records(attempts, zadanie_skill_map)
+    return {sid: mastery_from_record(record) for sid, record in records.items()}
 
 
 def get_skills_due_for_review(
     mastery: dict[str, dict],
     now: datetime | None = None,
 ) -> list[str]:
-    """Return skill IDs that are due for spaced-repetition review."""
+    """Return skill IDs that are due for spaced-repetition review, most overdue first.
+
+    Uses the precomputed next_due_at of each entry (see mastery_from_record), so no
+    intervals are recomputed here; the same value is stored in student_skill_mastery.
+    """
     if now is None:
         now = datetime.now(timezone.utc)
 
     due = []
     for sid, info in mastery.items():
-        if info["level"] <= 0:
-            continue
-        last = info.get("last_correct_at")
-        if last is None:
+        if "next_due_at" in info:
+            due_at = info["next_due_at"]
+        elif info["level"] > 0:
+            due_at = review_due_at(info.get("last_correct_at"), info.get("interval_index", 0))
+        else:
             continue
-        if last.tzinfo is None:
-            last = last.replace(tzinfo=timezone.utc)
-        idx = info.get("interval_index", 0)
-        interval = SPACED_INTERVALS_DAYS[min(idx, len(SPACED_INTERVALS_DAYS) - 1)]
-        if now - last >= timedelta(days=interval):
-            due.append(sid)
-    return due
+        if due_at is not None and due_at <= now:
+            due.append((due_at, sid))
+    due.sort()
+    return [sid for _, sid in due]
 
 
 def get_available_skills(
@@ -143,51 +193,106 @@ def get_available_skills(
     return available
 
 
+def mastered_mask(graph: GraphSnapshot, mastery: dict[str, dict]) -> int:
+    """Bitset (graph.skill_index) of skills at or above MASTERY_THRESHOLD."""
+    return graph.skills_mask(
+        sid for sid, m in mastery.items() if m.get("level", 0) >= MASTERY_THRESHOLD
+    )
+
+
 def recommend_task(
     driver: Driver,
+    graph: GraphSnapshot,
     user_id: str,
     attempts: list[dict],
     recent_dzial_ids: list[int] | None = None,
     target_skill_id: str | None = None,
     locked_skill_ids: set[str] | None = None,
+    mastery: dict[str, dict] | None = None,
 ) -> Optional[dict]:
-    """Recommend a task for the student.
+    """Recommend a task for the student (see choose_task_id for the priority order).
+
+    The graph structure comes from the in-memory snapshot (app/skill_graph.py);
+    Neo4j is only queried for the chosen task itself. Pass the student's stored
+    mastery (app/mastery.py) to skip recomputing it from the attempts.
+    """
+    if mastery is None:
+        mastery = compute_skill_mastery(attempts, graph.zadanie_skill_map)
+    chosen_id = choose_task_id(
+        graph,
+        graph.ids_mask(a["zadanie_id"] for a in attempts),
+        mastery,
+        recent_dzial_ids=recent_dzial_ids,
+        target_skill_id=target_skill_id,
+        locked_skill_ids=locked_skill_ids,
+    )
+    if chosen_id is None:
+        return None
+    return _fetch_zadanie_by_id(driver, chosen_id)
+
+
+def choose_task_id(
+    graph: GraphSnapshot,
+    attempted: int,
+    mastery: dict[str, dict],
+    recent_dzial_ids: list[int] | None = None,
+    target_skill_id: str | None = None,
+    locked_skill_ids: set[str] | None = None,
+    avoid: int = 0,
+) -> Optional[str]:
+    """Pick the id of the next task for a student, without touching Neo4j.
 
     Priority:
     1. If target_skill_id is set, pick a task testing that skill (unless locked)
     2. Skills due for spaced-repetition review (Ebbinghaus curve)
-    3. Available skills (not mastered, not locked), lowest mastery first, interleaved across dzialy
+    3. Available skills (not mastered, not locked), lowest mastery first, interleaved across dzialy;
+       skills whose WYMAGA prerequisites are all mastered go first (no hard blocking)
     4. Fallback: random unattempted task
-    """
-    with driver.session() as session:
-        zadanie_skill_map = _fetch_zadanie_skill_map(session)
-        all_skills = _fetch_all_skill_ids(session)
-        skill_dzial_map = _fetch_skill_dzial_map(session)
 
-    mastery = compute_skill_mastery(attempts, zadanie_skill_map)
-    attempted_ids = {a["zadanie_id"] for a in attempts}
+    attempted / avoid are task bitsets (graph.ids_mask). Tasks in avoid (e.g. already
+    handed to other students in the same batch) are skipped while alternatives exist.
+    """
+    skill_dzial_map = graph.skill_dzial_map
     locked = locked_skill_ids or set()
 
     if target_skill_id and target_skill_id not in locked:
-        return _pick_task_for_skills(
-            driver, [target_skill_id], attempted_ids, zadanie_skill_map
-        )
+        return _pick_task_for_skills(graph, [target_skill_id], attempted, avoid)
 
     due_skills = [s for s in get_skills_due_for_review(mastery) if s not in locked]
     if due_skills:
         if recent_dzial_ids:
             due_skills = _interleave_filter(due_skills, skill_dzial_map, recent_dzial_ids)
         if due_skills:
-            return _pick_task_for_skills(driver, due_skills, attempted_ids, zadanie_skill_map)
+            return _pick_task_for_skills(graph, due_skills, attempted, avoid)
 
-    available = get_available_skills(all_skills, mastery, locked)
+    available = get_available_skills(graph.all_skills, mastery, locked)
     if available:
+        available = _prereq_filter(available, graph, mastery)
         if recent_dzial_ids:
             available = _interleave_filter(available, skill_dzial_map, recent_dzial_ids)
         if available:
-            return _pick_task_for_skills(driver, available, attempted_ids, zadanie_skill_map)
+            return _pick_task_for_skills(graph, available, attempted, avoid)
 
-    return _pick_random_task(driver, attempted_ids)
+    return _pick_from(graph, graph.all_tasks_mask, attempted, avoid)
+
+
+def recent_dzial_ids(graph: GraphSnapshot, attempts: list[dict], last: int = 5) -> list[int]:
+    """Dzialy of the student's most recent attempts (attempts newest first), oldest → newest."""
+    seen: dict[int, None] = {}
+    for att in reversed(attempts[:last]):
+        for sid in graph.zadanie_skill_map.get(att.get("zadanie_id"), ()):
+            did = graph.skill_dzial_map.get(sid)
+            if did is not None:
+                seen.pop(did, None)
+                seen[did] = None
+    return list(seen)
+
+
+def _prereq_filter(skill_ids: list[str], graph: GraphSnapshot, mastery: dict[str, dict]) -> list[str]:
+    """Prefer skills whose prerequisites are all mastered."""
+    mastered = mastered_mask(graph, mastery)
+    unlocked = [s for s in skill_ids if graph.prereqs_met(s, mastered)]
+    return unlocked if unlocked else skill_ids
 
 
 def _interleave_filter(
@@ -202,72 +307,61 @@ def _interleave_filter(
 
 
 def _pick_task_for_skills(
-    driver: Driver,
+    graph: GraphSnapshot,
     skill_ids: list[str],
-    attempted_ids: set[str],
-    zadanie_skill_map: dict[str, list[str]],
-) -> Optional[dict]:
+    attempted: int,
+    avoid: int = 0,
+) -> Optional[str]:
     """Pick a task that tests one of the given skills, preferring unattempted."""
-    candidates = set()
-    for zid, sids in zadanie_skill_map.items():
-        if any(s in skill_ids for s in sids):
-            candidates.add(zid)
-
-    unattempted = candidates - attempted_ids
-    pool = unattempted if unattempted else candidates
+    return _pick_from(graph, graph.tasks_mask(skill_ids), attempted, avoid)
 
-    if not pool:
-        return None
 
-    chosen_id = random.choice(list(pool))
-    return _fetch_zadanie_by_id(driver, chosen_id)
+def _pick_from(graph: GraphSnapshot, candidates: int, attempted: int, avoid: int = 0) -> Optional[str]:
+    """Random task from candidates: unattempted and not avoided first, then unattempted, then any."""
+    unattempted = candidates & ~attempted
+    pool = (unattempted & ~avoid) or unattempted or candidates
+    return graph.pick(pool)
 
 
-def _pick_random_task(driver: Driver, attempted_ids: set[str]) -> Optional[dict]:
-    """Pick a random task the student hasn't attempted."""
-    with driver.session() as session:
-        result = session.run("MATCH (z:Zadanie) RETURN z.id AS id")
-        all_ids = [r["id"] for r in result]
+# --- Neo4j query helpers ---
 
-    unattempted = [i for i in all_ids if i not in attempted_ids]
-    pool = unattempted if unattempted else all_ids
+_ZADANIE_BY_ID_QUERY = """
+    MATCH (z:Zadanie {id: $zid})
+    OPTIONAL MATCH (z)-[:SPRAWDZA]->(u:Umiejetnosc)
+    RETURN z, collect({id: u.id, opis: u.opis}) AS umiejetnosci
+    """
+_ZADANIA_BY_IDS_QUERY = """
+    MATCH (z:Zadanie) WHERE z.id IN $zids
+    OPTIONAL MATCH (z)-[:SPRAWDZA]->(u:Umiejetnosc)
+    RETURN z, collect({id: u.id, opis: u.opis}) AS umiejetnosci
+    """
+_DZIALY_QUERY = "MATCH (d:Dzial) RETURN d.id AS id, d.nazwa AS nazwa ORDER BY d.id"
+_ALL_TASKS_MATCH = "MATCH (z:Zadanie)"
+_DZIAL_TASKS_MATCH = "MATCH (d:Dzial {id: $did})-[:ZAWIERA]->(:Umiejetnosc)<-[:SPRAWDZA]-(z:Zadanie)"
 
-    if not pool:
-        return None
+def _fetch_zadanie_by_id(driver: Driver, zadanie_id: str) -> Optional[dict]:
+    with driver.session() as session:
+        result = session.run(_ZADANIE_BY_ID_QUERY, zid=zadanie_id)
+        record = result.single()
+        return _task_from_record(record) if record else None
 
-    chosen_id = random.choice(pool)
-    return _fetch_zadanie_by_id(driver, chosen_id)
 
+def fetch_zadania_by_ids(driver: Driver, zadanie_ids: list[str]) -> dict[str, dict]:
+    """Hydrate several tasks in one query: {id: task} (missing ids are left out)."""
+    if not zadanie_ids:
+        return {}
+    with driver.session() as session:
+        result = session.run(_ZADANIA_BY_IDS_QUERY, zids=list(zadanie_ids))
+        tasks = {}
+        for record in result:
+            task = _task_from_record(record)
+            tasks[task["id"]] = task
+        return tasks
 
-# --- Neo4j query helpers ---
 
-def _fetch_zadanie_by_id(driver: Driver, zadanie_id: str) -> Optional[dict]:
-    with driver.session() as session:
-        result = session.run(
-            """
-            MATCH (z:Zadanie {id: $zid})
-            OPTIONAL MATCH (z)-[:SPRAWDZA]->(u:Umiejetnosc)
-            RETURN z, collect({id: u.id, opis: u.opis}) AS umiejetnosci
-            """,
-            zid=zadanie_id,
-        )
-        record = result.single()
-        if not record:
-            return None
-        z = record["z"]
-        umiejetnosci = [u for u in record["umiejetnosci"] if u.get("id")]
-        return {
-            "id": z["id"],
-            "numer": z.get("numer"),
-            "data": z.get("data"),
-            "punkty": z.get("punkty", 1),
-            "typ": z.get("typ", ""),
-            "podtyp": z.get("podtyp", ""),
-            "tresc": z.get("tresc", ""),
-            "odpowiedzi": z.get("odpowiedzi", []),
-            "tikz": z.get("tikz", ""),
-            "umiejetnosci": umiejetnosci,
-        }
+def _fetch_all_task_ids(session) -> list[str]:
+    result = session.run("MATCH (z:Zadanie) RETURN z.id AS id")
+    return [r["id"] for r in result]
 
 
 def _fetch_zadanie_skill_map(session) -> dict[str, list[str]]:
@@ -296,163 +390,294 @@ def _fetch_skill_dzial_map(session) -> dict[str, int]:
     return {r["uid"]: r["did"] for r in result}
 
 
+def _fetch_dzial_rows(session) -> list[dict]:
+    result = session.run(_DZIALY_QUERY)
+    return [{"id": r["id"], "nazwa": r["nazwa"]} for r in result]
+
+
+def _fetch_skill_rows(session) -> list[dict]:
+    result = session.run(
+        """
+        MATCH (d:Dzial)-[:ZAWIERA]->(u:Umiejetnosc)
+        RETURN u.id AS id, u.opis AS opis, d.id AS dzial_id
+        """
+    )
+    return [{"id": r["id"], "opis": r["opis"], "dzial_id": r["dzial_id"]} for r in result]
+
+
 def fetch_dzialy(driver: Driver) -> list[dict]:
     with driver.session() as session:
-        result = session.run("MATCH (d:Dzial) RETURN d.id AS id, d.nazwa AS nazwa ORDER BY d.id")
-        return [{"id": r["id"], "nazwa": r["nazwa"]} for r in result]
+        return _fetch_dzial_rows(session)
+
+
+TASK_FIELDS = ("id", "numer", "data", "punkty", "typ", "podtyp", "tresc", "odpowiedzi", "tikz", "umiejetnosci")
+_TASK_DEFAULTS = {"punkty": 1, "typ": "", "podtyp": "", "tresc": "", "odpowiedzi": [], "tikz": ""}
 
 
-def fetch_all_tasks(driver: Driver, skip: int = 0, limit: int = 500) -> list[dict]:
-    """Fetch all Zadanie nodes (temporary tool)."""
+def parse_task_fields(fields: str | None) -> tuple[str, ...]:
+    """Comma-separated ?fields= value → validated fields in TASK_FIELDS order (id always included)."""
+    if not fields:
+        return TASK_FIELDS
+    requested = {f.strip() for f in fields.split(",") if f.strip()}
+    unknown = requested.difference(TASK_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+    requested.add("id")
+    return tuple(f for f in TASK_FIELDS if f in requested)
+
+
+def _task_list_query(match: str, fields: tuple[str, ...], keyset: bool = False) -> str:
+    """Page on z.id (keyset via $after, SKIP kept for old clients) before touching skills or
+    task properties, then return only the requested properties.
+
+    The id predicate is only emitted when there is a cursor (an OR over a null $after
+    defeats the index), so every page of the whole-graph listing is an index range
+    read in id order instead of a label scan and sort.
+    """
+    if keyset:
+        where = "\n        WHERE z.id > $after"
+    elif match == _ALL_TASKS_MATCH:
+        where = "\n        WHERE z.id IS NOT NULL"
+    else:
+        where = ""
+    # Only the dzial traversal can reach a task twice (once per checked skill).
+    distinct = "" if match == _ALL_TASKS_MATCH else "DISTINCT "
+    projection = ", ".join(f".{f}" for f in fields if f != "umiejetnosci")
+    skills = (
+        """
+        OPTIONAL MATCH (z)-[:SPRAWDZA]->(su:Umiejetnosc)
+        WITH z, collect({id: su.id, opis: su.opis}) AS umiejetnosci"""
+        if "umiejetnosci" in fields
+        else "\n        WITH z, [] AS umiejetnosci"
+    )
+    return f"""
+        {match}{where}
+        WITH {distinct}z
+        ORDER BY z.id
+        SKIP $skip LIMIT $limit{skills}
+        RETURN z {{{projection}}} AS z, umiejetnosci
+        ORDER BY z.id
+        """
+
+
+def _task_from_record(record, fields: tuple[str, ...] = TASK_FIELDS) -> dict:
+    z = record["z"]
+    task = {}
+    for f in fields:
+        if f != "umiejetnosci":
+            value = z.get(f)  # a map projection returns missing properties as null
+            task[f] = _TASK_DEFAULTS.get(f) if value is None else value
+    if "umiejetnosci" in fields:
+        task["umiejetnosci"] = [u for u in record["umiejetnosci"] if u.get("id")]
+    return task
+
+
+def fetch_all_tasks(
+    driver: Driver,
+    skip: int = 0,
+    limit: int = 500,
+    after: str | None = None,
+    fields: tuple[str, ...] = TASK_FIELDS,
+) -> list[dict]:
+    """Fetch Zadanie nodes ordered by id (temporary tool).
+
+    Pass the last id of the previous page as `after` (keyset pagination); `fields`
+    limits the returned properties (see parse_task_fields).
+    """
     with driver.session() as session:
         result = session.run(
-            """
-            MATCH (z:Zadanie)
-            OPTIONAL MATCH (z)-[:SPRAWDZA]->(u:Umiejetnosc)
-            WITH z, collect({id: u.id, opis: u.opis}) AS umiejetnosci
-            RETURN z, umiejetnosci
-            ORDER BY z.id
-            SKIP $skip LIMIT $limit
-            """,
+            _task_list_query(_ALL_TASKS_MATCH, fields, keyset=after is not None),
+            after=after,
             skip=skip,
             limit=limit,
         )
-        tasks = []
-        for record in result:
-            z = record["z"]
-            umiejetnosci = [u for u in record["umiejetnosci"] if u.get("id")]
-            tasks.append({
-                "id": z["id"],
-                "numer": z.get("numer"),
-                "data": z.get("data"),
-                "punkty": z.get("punkty", 1),
-                "typ": z.get("typ", ""),
-                "podtyp": z.get("podtyp", ""),
-                "tresc": z.get("tresc", ""),
-                "odpowiedzi": z.get("odpowiedzi", []),
-                "tikz": z.get("tikz", ""),
-                "umiejetnosci": umiejetnosci,
-            })
-        return tasks
+        return [_task_from_record(record, fields) for record in result]
 
 
-def fetch_tasks_by_dzial(driver: Driver, dzial_id: int, skip: int = 0, limit: int = 20) -> list[dict]:
+def fetch_tasks_by_dzial(
+    driver: Driver,
+    dzial_id: int,
+    skip: int = 0,
+    limit: int = 20,
+    after: str | None = None,
+    fields: tuple[str, ...] = TASK_FIELDS,
+) -> list[dict]:
     with driver.session() as session:
         result = session.run(
-            """
-            MATCH (d:Dzial {id: $did})-[:ZAWIERA]->(u:Umiejetnosc)<-[:SPRAWDZA]-(z:Zadanie)
-            WITH DISTINCT z
-            OPTIONAL MATCH (z)-[:SPRAWDZA]->(u2:Umiejetnosc)
-            RETURN z, collect({id: u2.id, opis: u2.opis}) AS umiejetnosci
-            ORDER BY z.id
-            SKIP $skip LIMIT $limit
-            """,
+            _task_list_query(_DZIAL_TASKS_MATCH, fields, keyset=after is not None),
             did=dzial_id,
+            after=after,
             skip=skip,
             limit=limit,
         )
-        tasks = []
-        for record in result:
-            z = record["z"]
-            umiejetnosci = [u for u in record["umiejetnosci"] if u.get("id")]
-            tasks.append({
-                "id": z["id"],
-                "numer": z.get("numer"),
-                "data": z.get("data"),
-                "punkty": z.get("punkty", 1),
-                "typ": z.get("typ", ""),
-                "podtyp": z.get("podtyp", ""),
-                "tresc": z.get("tresc", ""),
-                "odpowiedzi": z.get("odpowiedzi", []),
-                "tikz": z.get("tikz", ""),
-                "umiejetnosci": umiejetnosci,
-            })
+        return [_task_from_record(record, fields) for record in result]
+
+
+# Lookups that must start from an id index (see neo4j.ensure_schema); full-graph reads
+# such as the snapshot loaders scan by design and are not listed.
+INDEXED_QUERIES: dict[str, tuple[str, dict]] = {
+    "zadanie_by_id": (_ZADANIE_BY_ID_QUERY, {"zid": ""}),
+    "zadania_by_ids": (_ZADANIA_BY_IDS_QUERY, {"zids": [""]}),
+    "tasks_by_dzial": (
+        _task_list_query(_DZIAL_TASKS_MATCH, TASK_FIELDS, keyset=True),
+        {"did": 0, "after": "", "skip": 0, "limit": 20},
+    ),
+    "tasks_all_first_page": (
+        _task_list_query(_ALL_TASKS_MATCH, TASK_FIELDS),
+        {"after": None, "skip": 0, "limit": 20},
+    ),
+    "tasks_all_after": (
+        _task_list_query(_ALL_TASKS_MATCH, TASK_FIELDS, keyset=True),
+        {"after": "", "skip": 0, "limit": 20},
+    ),
+}
+
+
+def fetch_random_task(
+    driver: Driver,
+    graph: GraphSnapshot,
+    dzial_id: int | None = None,
+    attempted: int = 0,
+) -> Optional[dict]:
+    """Random task (optionally from a dzial), preferring unattempted ones.
+
+    Sampled from the snapshot's id arrays (no ORDER BY rand() over the graph), then
+    hydrated by id. attempted is a task bitset (graph.ids_mask).
+    """
+    chosen_id = graph.sample_task(dzial_id, attempted)
+    if chosen_id is None:
+        return None
+    return _fetch_zadanie_by_id(driver, chosen_id)
+
+
+# --- Async variants (endpoints, app.neo4j.get_neo4j_async) ---
+
+async def fetch_zadanie_by_id_async(driver: AsyncDriver, zadanie_id: str) -> Optional[dict]:
+    async with driver.session() as session:
+        result = await session.run(_ZADANIE_BY_ID_QUERY, zid=zadanie_id)
+        record = await result.single()
+        return _task_from_record(record) if record else None
+
+
+async def fetch_zadania_by_ids_async(driver: AsyncDriver, zadanie_ids: list[str]) -> dict[str, dict]:
+    if not zadanie_ids:
+        return {}
+    async with driver.session() as session:
+        result = await session.run(_ZADANIA_BY_IDS_QUERY, zids=list(zadanie_ids))
+        tasks = {}
+        async for record in result:
+            task = _task_from_record(record)
+            tasks[task["id"]] = task
         return tasks
 
 
-def fetch_random_task(driver: Driver, dzial_id: int | None = None) -> Optional[dict]:
-    with driver.session() as session:
-        if dzial_id is not None:
-            result = session.run(
-                """
-                MATCH (d:Dzial {id: $did})-[:ZAWIERA]->(u:Umiejetnosc)<-[:SPRAWDZA]-(z:Zadanie)
-                WITH DISTINCT z, rand() AS r
-                ORDER BY r LIMIT 1
-                OPTIONAL MATCH (z)-[:SPRAWDZA]->(u2:Umiejetnosc)
-                RETURN z, collect({id: u2.id, opis: u2.opis}) AS umiejetnosci
-                """,
-                did=dzial_id,
-            )
-        else:
-            result = session.run(
-                """
-                MATCH (z:Zadanie)
-                WITH z, rand() AS r
-                ORDER BY r LIMIT 1
-                OPTIONAL MATCH (z)-[:SPRAWDZA]->(u:Umiejetnosc)
-                RETURN z, collect({id: u.id, opis: u.opis}) AS umiejetnosci
-                """
-            )
-        record = result.single()
-        if not record:
-            return None
-        z = record["z"]
-        umiejetnosci = [u for u in record["umiejetnosci"] if u.get("id")]
-        return {
-            "id": z["id"],
-            "numer": z.get("numer"),
-            "data": z.get("data"),
-            "punkty": z.get("punkty", 1),
-            "typ": z.get("typ", ""),
-            "podtyp": z.get("podtyp", ""),
-            "tresc": z.get("tresc", ""),
-            "odpowiedzi": z.get("odpowiedzi", []),
-            "tikz": z.get("tikz", ""),
-            "umiejetnosci": umiejetnosci,
-        }
+async def fetch_dzialy_async(driver: AsyncDriver) -> list[dict]:
+    async with driver.session() as session:
+        result = await session.run(_DZIALY_QUERY)
+        return [{"id": r["id"], "nazwa": r["nazwa"]} async for r in result]
+
+
+async def fetch_all_tasks_async(
+    driver: AsyncDriver,
+    skip: int = 0,
+    limit: int = 500,
+    after: str | None = None,
+    fields: tuple[str, ...] = TASK_FIELDS,
+) -> list[dict]:
+    async with driver.session() as session:
+        result = await session.run(
+            _task_list_query(_ALL_TASKS_MATCH, fields, keyset=after is not None),
+            after=after,
+            skip=skip,
+            limit=limit,
+        )
+        return [_task_from_record(record, fields) async for record in result]
+
+
+async def fetch_tasks_by_dzial_async(
+    driver: AsyncDriver,
+    dzial_id: int,
+    skip: int = 0,
+    limit: int = 20,
+    after: str | None = None,
+    fields: tuple[str, ...] = TASK_FIELDS,
+) -> list[dict]:
+    async with driver.session() as session:
+        result = await session.run(
+            _task_list_query(_DZIAL_TASKS_MATCH, fields, keyset=after is not None),
+            did=dzial_id,
+            after=after,
+            skip=skip,
+            limit=limit,
+        )
+        return [_task_from_record(record, fields) async for record in result]
+
+
+async def fetch_random_task_async(
+    driver: AsyncDriver,
+    graph: GraphSnapshot,
+    dzial_id: int | None = None,
+    attempted: int = 0,
+) -> Optional[dict]:
+    chosen_id = graph.sample_task(dzial_id, attempted)
+    if chosen_id is None:
+        return None
+    return await fetch_zadanie_by_id_async(driver, chosen_id)
+
+
+async def recommend_task_async(
+    driver: AsyncDriver,
+    graph: GraphSnapshot,
+    attempts: list[dict],
+    recent_dzial_ids: list[int] | None = None,
+    target_skill_id: str | None = None,
+    locked_skill_ids: set[str] | None = None,
+    mastery: dict[str, dict] | None = None,
+) -> Optional[dict]:
+    """recommend_task for endpoints: selection runs in a worker thread, the hydration query is awaited."""
+
+    def choose() -> Optional[str]:
+        skill_mastery = mastery
+        if skill_mastery is None:
+            skill_mastery = compute_skill_mastery(attempts, graph.zadanie_skill_map)
+        return choose_task_id(
+            graph,
+            graph.ids_mask(a["zadanie_id"] for a in attempts),
+            skill_mastery,
+            recent_dzial_ids=recent_dzial_ids,
+            target_skill_id=target_skill_id,
+            locked_skill_ids=locked_skill_ids,
+        )
+
+    chosen_id = await asyncio.to_thread(choose)
+    if chosen_id is None:
+        return None
+    return await fetch_zadanie_by_id_async(driver, chosen_id)
 
 
 def fetch_skill_map(
-    driver: Driver,
+    graph: GraphSnapshot,
     user_attempts: list[dict],
     locked_skill_ids: set[str] | None = None,
+    mastery: dict[str, dict] | None = None,
 ) -> dict:
-    """Return the full skill graph with mastery data for the skill map visualization.
+    """Return the student's mastery overlay for the skill map visualization.
+
+    The graph itself (dzialy, skills, WYMAGA edges) is served separately and cached by
+    version (GraphSnapshot.skill_graph_json); "version" here tells the client which
+    graph the statuses belong to.
 
     locked_skill_ids: admin-locked skill IDs for this user (only these show as 'locked').
+    mastery: stored per-skill mastery; computed from user_attempts when None.
     """
-    with driver.session() as session:
-        zadanie_skill_map = _fetch_zadanie_skill_map(session)
-
-        dzialy_raw = session.run(
-            "MATCH (d:Dzial) RETURN d.id AS id, d.nazwa AS nazwa ORDER BY d.id"
-        )
-        dzialy = [{"id": r["id"], "nazwa": r["nazwa"]} for r in dzialy_raw]
-
-        skills_raw = session.run(
-            """
-            MATCH (d:Dzial)-[:ZAWIERA]->(u:Umiejetnosc)
-            RETURN u.id AS id, u.opis AS opis, d.id AS dzial_id
-            """
-        )
-        umiejetnosci = [
-            {"id": r["id"], "opis": r["opis"], "dzial_id": r["dzial_id"]}
-            for r in skills_raw
-        ]
-
-        wymaga_raw = session.run(
-            "MATCH (a:Umiejetnosc)-[:WYMAGA]->(b:Umiejetnosc) RETURN a.id AS from_id, b.id AS to_id"
-        )
-        wymaga_edges = [
-            {"from": r["from_id"], "to": r["to_id"]}
-            for r in wymaga_raw
-        ]
-
-    mastery = compute_skill_mastery(user_attempts, zadanie_skill_map)
+    if mastery is None:
+        mastery = compute_skill_mastery(user_attempts, graph.zadanie_skill_map)
     locked = locked_skill_ids or set()
 
+    mastered = mastered_mask(graph, mastery)
+
     mastery_out = {}
-    for u in umiejetnosci:
+    for u in graph.umiejetnosci:
         sid = u["id"]
         m = mastery.get(sid, {})
         level = m.get("level", 0)
@@ -471,11 +696,7 @@ def fetch_skill_map(
             "level": round(level, 2),
             "attempts": attempts,
             "status": status,
+            "prereqs_met": graph.prereqs_met(sid, mastered),
         }
 
-    return {
-        "dzialy": dzialy,
-        "umiejetnosci": umiejetnosci,
-        "wymaga_edges": wymaga_edges,
-        "mastery": mastery_out,
-    }
+    return {"version": graph.version, "mastery": mastery_out}
@@ -0,0 +1,317 @@
+"""Process-wide, immutable snapshot of the skill graph for the recommendation engine.
+
+The Neo4j skill graph (Dzial, Umiejetnosc, WYMAGA, Zadanie-[:SPRAWDZA]) only changes
+when content is imported, so recommendations read it from an in-memory snapshot
+instead of scanning the graph on every request. A snapshot is built once at startup
+and replaced atomically (a single reference swap) by a periodic refresh
+(SKILL_GRAPH_REFRESH_SECONDS) or by POST /admin/graph/refresh after an import.
+Readers never see a half-loaded graph: they keep the snapshot they started with.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import random
+import threading
+import time
+from dataclasses import dataclass
+from functools import cached_property
+from typing import Optional
+
+from neo4j import Driver
+
+from .skill_engine import (
+    _fetch_all_skill_ids,
+    _fetch_all_task_ids,
+    _fetch_dzial_rows,
+    _fetch_skill_dzial_map,
+    _fetch_skill_rows,
+    _fetch_wymaga_edges,
+    _fetch_zadanie_skill_map,
+)
+
+logger = logging.getLogger(__name__)
+
+# Seconds between background reloads; 0 disables the timer (admin trigger only).
+REFRESH_SECONDS = float(os.environ.get("SKILL_GRAPH_REFRESH_SECONDS", "600"))
+
+
+@dataclass(frozen=True)
+class GraphSnapshot:
+    """Read-only view of the skill graph. The containers are shared between requests: never mutate them."""
+
+    version: str
+    loaded_at: float
+    task_ids: tuple[str, ...]
+    zadanie_skill_map: dict[str, tuple[str, ...]]
+    all_skills: tuple[str, ...]
+    skill_dzial_map: dict[str, int]
+    wymaga_edges: tuple[tuple[str, str], ...]
+    dzialy: tuple[dict, ...]
+    umiejetnosci: tuple[dict, ...]
+    # Inverted index. Tasks are int-coded by their position in task_ids and task sets are
+    # int bitsets (bit i = task_ids[i]), so candidate pools are a few big-int ORs/ANDs
+    # instead of a scan over every task.
+    task_index: dict[str, int]
+    skill_task_bits: dict[str, int]
+    # Prerequisites. Skills are int-coded by their position in all_skills; prereq_closure[i]
+    # is the bitset of every skill that all_skills[i] transitively WYMAGA, so "all
+    # prerequisites mastered" is one AND against the student's mastered-skill bitset.
+    skill_index: dict[str, int]
+    prereq_closure: tuple[int, ...]
+    # Tasks per dzial (via ZAWIERA/SPRAWDZA), as id arrays for O(1) sampling and as bitsets.
+    dzial_task_ids: dict[int, tuple[str, ...]]
+    dzial_task_bits: dict[int, int]
+
+    @property
+    def all_tasks_mask(self) -> int:
+        return (1 << len(self.task_ids)) - 1
+
+    def tasks_mask(self, skill_ids) -> int:
+        """Bitset of tasks that test any of the given skills."""
+        mask = 0
+        for sid in skill_ids:
+            mask |= self.skill_task_bits.get(sid, 0)
+        return mask
+
+    def ids_mask(self, zadanie_ids) -> int:
+        """Bitset of the given task ids (ids missing from the graph are ignored)."""
+        mask = 0
+        for zid in zadanie_ids:
+            idx = self.task_index.get(zid)
+            if idx is not None:
+                mask |= 1 << idx
+        return mask
+
+    def skills_mask(self, skill_ids) -> int:
+        mask = 0
+        for sid in skill_ids:
+            idx = self.skill_index.get(sid)
+            if idx is not None:
+                mask |= 1 << idx
+        return mask
+
+    def prereqs_met(self, skill_id: str, mastered: int) -> bool:
+        """True if every (transitive) prerequisite of the skill is in the mastered bitset."""
+        idx = self.skill_index.get(skill_id)
+        return idx is None or not (self.prereq_closure[idx] & ~mastered)
+
+    def pick(self, mask: int, rng: random.Random | None = None) -> Optional[str]:
+        """Uniformly random task id from a bitset, or None if it is empty."""
+        count = mask.bit_count()
+        if not count:
+            return None
+        return self.task_ids[_nth_set_bit(mask, (rng or random).randrange(count))]
+
+    def sample_task(self, dzial_id: Optional[int] = None, attempted: int = 0, tries: int = 8) -> Optional[str]:
+        """Random task id (optionally within a dzial), preferring ones not in the attempted bitset.
+
+        A few O(1) draws from the id array usually succeed; if the student has attempted
+        most of the pool, fall back to an exact pick over the bitset difference.
+        """
+        if dzial_id is None:
+            ids, mask = self.task_ids, self.all_tasks_mask
+        else:
+            ids, mask = self.dzial_task_ids.get(dzial_id, ()), self.dzial_task_bits.get(dzial_id, 0)
+        if not ids:
+            return None
+        for _ in range(tries):
+            zid = random.choice(ids)
+            if not attempted >> self.task_index[zid] & 1:
+                return zid
+        return self.pick((mask & ~attempted) or mask)
+
+    @cached_property
+    def skill_graph_json(self) -> bytes:
+        """Static part of the skill map (GET /tasks/skill-graph), serialized once per snapshot.
+
+        Clients cache it under ETag = version; /tasks/skill-map only sends the per-student overlay.
+        """
+        payload = {
+            "version": self.version,
+            "dzialy": list(self.dzialy),
+            "umiejetnosci": list(self.umiejetnosci),
+            "wymaga_edges": [{"from": a, "to": b} for a, b in self.wymaga_edges],
+        }
+        return json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    def summary(self) -> dict:
+        return {
+            "version": self.version,
+            "loaded_at": self.loaded_at,
+            "tasks": len(self.task_ids),
+            "skills": len(self.all_skills),
+            "wymaga_edges": len(self.wymaga_edges),
+        }
+
+
+def _words(mask: int):
+    """Yield (bit offset, 64-bit word) pairs of a bitset, lowest first."""
+    data = mask.to_bytes((mask.bit_length() + 7) // 8, "little")
+    for i in range(0, len(data), 8):
+        yield i * 8, int.from_bytes(data[i:i + 8], "little")
+
+
+def _nth_set_bit(mask: int, n: int) -> int:
+    """Index of the n-th (0-based) set bit; skips whole words by popcount."""
+    for offset, word in _words(mask):
+        count = word.bit_count()
+        if n >= count:
+            n -= count
+            continue
+        for _ in range(n):
+            word &= word - 1
+        return offset + (word & -word).bit_length() - 1
+    raise IndexError("bit index out of range")
+
+
+def _build_index(task_ids: list[str], zadanie_skill_map: dict[str, tuple[str, ...]]):
+    task_index = {zid: i for i, zid in enumerate(task_ids)}
+    skill_task_bits: dict[str, int] = {}
+    for zid, sids in zadanie_skill_map.items():
+        bit = 1 << task_index[zid]
+        for sid in sids:
+            skill_task_bits[sid] = skill_task_bits.get(sid, 0) | bit
+    return task_index, skill_task_bits
+
+
+def _build_dzial_tasks(task_ids, skill_dzial_map, skill_task_bits):
+    dzial_task_bits: dict[int, int] = {}
+    for sid, bits in skill_task_bits.items():
+        did = skill_dzial_map.get(sid)
+        if did is not None:
+            dzial_task_bits[did] = dzial_task_bits.get(did, 0) | bits
+    dzial_task_ids = {
+        did: tuple(task_ids[i] for i in range(bits.bit_length()) if bits >> i & 1)
+        for did, bits in dzial_task_bits.items()
+    }
+    return dzial_task_ids, dzial_task_bits
+
+
+def _build_prereq_closure(all_skills: list[str], wymaga_edges: list[tuple[str, str]]):
+    """Transitive closure of WYMAGA (a)-[:WYMAGA]->(b) as per-skill bitsets. Cycles are tolerated."""
+    skill_index = {sid: i for i, sid in enumerate(all_skills)}
+    requires: dict[int, list[int]] = {}
+    for a, b in wymaga_edges:
+        if a in skill_index and b in skill_index:
+            requires.setdefault(skill_index[a], []).append(skill_index[b])
+
+    closure = []
+    for start in range(len(all_skills)):
+        bits, stack = 0, list(requires.get(start, ()))
+        while stack:
+            node = stack.pop()
+            if bits >> node & 1:
+                continue
+            bits |= 1 << node
+            stack.extend(requires.get(node, ()))
+        closure.append(bits & ~(1 << start))
+    return skill_index, tuple(closure)
+
+
+def _content_version(*parts) -> str:
+    """Stable digest of the graph content, so an unchanged graph keeps its version across reloads."""
+    payload = json.dumps(parts, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def load_graph_snapshot(driver: Driver) -> GraphSnapshot:
+    """Read the whole skill graph from Neo4j in one session."""
+    with driver.session() as session:
+        zadanie_skill_map = {
+            zid: tuple(sorted(sids)) for zid, sids in sorted(_fetch_zadanie_skill_map(session).items())
+        }
+        task_ids = sorted(set(_fetch_all_task_ids(session)) | zadanie_skill_map.keys())
+        all_skills = sorted(_fetch_all_skill_ids(session))
+        skill_dzial_map = dict(sorted(_fetch_skill_dzial_map(session).items()))
+        wymaga_edges = sorted(_fetch_wymaga_edges(session))
+        dzialy = _fetch_dzial_rows(session)
+        umiejetnosci = sorted(_fetch_skill_rows(session), key=lambda u: u["id"])
+
+    task_index, skill_task_bits = _build_index(task_ids, zadanie_skill_map)
+    skill_index, prereq_closure = _build_prereq_closure(all_skills, wymaga_edges)
+    dzial_task_ids, dzial_task_bits = _build_dzial_tasks(task_ids, skill_dzial_map, skill_task_bits)
+    return GraphSnapshot(
+        version=_content_version(
+            task_ids, zadanie_skill_map, all_skills, skill_dzial_map, wymaga_edges, dzialy, umiejetnosci
+        ),
+        loaded_at=time.time(),
+        task_ids=tuple(task_ids),
+        zadanie_skill_map=zadanie_skill_map,
+        all_skills=tuple(all_skills),
+        skill_dzial_map=skill_dzial_map,
+        wymaga_edges=tuple(wymaga_edges),
+        dzialy=tuple(dzialy),
+        umiejetnosci=tuple(umiejetnosci),
+        task_index=task_index,
+        skill_task_bits=skill_task_bits,
+        skill_index=skill_index,
+        prereq_closure=prereq_closure,
+        dzial_task_ids=dzial_task_ids,
+        dzial_task_bits=dzial_task_bits,
+    )
+
+
+_snapshot: Optional[GraphSnapshot] = None
+_load_lock = threading.Lock()
+
+
+def _swap(snapshot: GraphSnapshot) -> GraphSnapshot:
+    global _snapshot
+    previous = _snapshot
+    _snapshot = snapshot
+    if previous is None or previous.version != snapshot.version:
+        logger.info("skill graph snapshot loaded: %s", snapshot.summary())
+    return snapshot
+
+
+def refresh_graph_snapshot(driver: Driver) -> GraphSnapshot:
+    """Reload the graph and publish it. On failure the previous snapshot stays in place."""
+    with _load_lock:
+        return _swap(load_graph_snapshot(driver))
+
+
+def get_graph_snapshot(driver: Driver) -> GraphSnapshot:
+    """Return the current snapshot, loading it on first use if startup could not."""
+    snapshot = _snapshot
+    if snapshot is not None:
+        return snapshot
+    with _load_lock:
+        if _snapshot is None:
+            _swap(load_graph_snapshot(driver))
+        return _snapshot
+
+
+async def get_graph_snapshot_async(driver: Driver) -> GraphSnapshot:
+    """get_graph_snapshot for async handlers: a first-use load runs in a worker thread."""
+    snapshot = _snapshot
+    if snapshot is not None:
+        return snapshot
+    return await asyncio.to_thread(get_graph_snapshot, driver)
+
+
+async def _refresh_periodically(driver: Driver, interval: float) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await asyncio.to_thread(refresh_graph_snapshot, driver)
+        except Exception as e:
+            current = _snapshot.version if _snapshot else None
+            logger.warning("skill graph refresh failed (keeping %s): %s", current, e)
+
+
+def start_graph_refresher(driver: Optional[Driver]) -> Optional[asyncio.Task]:
+    """Load the first snapshot and start the refresh timer. Call from the app lifespan."""
+    if not driver:
+        return None
+    try:
+        refresh_graph_snapshot(driver)
+    except Exception as e:
+        logger.warning("skill graph snapshot not loaded at startup (will load on first use): %s", e)
+    if REFRESH_SECONDS <= 0:
+        return None
+    return asyncio.create_task(_refresh_periodically(driver, REFRESH_SECONDS))
@@ -0,0 +1,792 @@
+"""TikZ → SVG rendering (pdflatex + pdf2svg, or latex + dvisvgm) with a content-addressed cache.
+
+Rendered diagrams are keyed by the SHA-256 of the prepared TikZ source.
+A bounded in-process LRU sits in front of an on-disk store that is trimmed
+by total size, so a diagram is compiled once and then served from cache.
+
+The fixed preamble (tikz, pgfplots, lmodern, amsmath) is dumped once into a
+TeX format at startup (mylatexformat), so each render only pays for
+typesetting the diagram body.
+
+Renders run on a dedicated thread pool behind a bounded queue; when the queue
+is full callers get RenderQueueFull instead of piling more work on the server.
+
+Batches of single-picture snippets are compiled as pages of one standalone
+document (one TeX run, one converter run) and split back into per-diagram SVGs.
+Concurrent requests for the same diagram share one in-flight render.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import gzip
+import hashlib
+import logging
+import os
+import re
+import subprocess
+import tempfile
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import NamedTuple, Optional
+
+from dotenv import load_dotenv
+
+from .metrics import histogram, register_collector
+
+try:
+    import brotli
+except ImportError:  # optional: without it only gzip variants are stored
+    brotli = None
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+TIKZ_PREAMBLE = r"""\documentclass[tikz,border=20pt]{standalone}
+\usepackage[utf8]{inputenc}
+\usepackage[T1]{fontenc}
+\usepackage{lmodern}
+\usepackage{amsmath}
+\usepackage{pgfplots}
+\pgfplotsset{compat=1.18}
+\usetikzlibrary{angles,quotes,calc,matrix,arrows.meta,positioning}
+"""
+
+# pgf must use its dvisvgm driver when typesetting to DVI for dvisvgm.
+DVISVGM_DRIVER = "\\def\\pgfsysdriver{pgfsys-dvisvgm.def}\n"
+# Embed fonts as WOFF and add the same 20pt margin that standalone's border gives the PDF.
+DVISVGM_ARGS = ["--font-format=woff", "--exact-bbox", "--bbox=20pt"]
+
+# TIKZ_RENDER_BACKEND: "pdf2svg" (pdflatex → PDF → pdf2svg) or "dvisvgm" (latex → DVI → dvisvgm)
+RENDER_BACKEND = os.environ.get("TIKZ_RENDER_BACKEND", "pdf2svg")
+_ENGINES = {"pdf2svg": "pdflatex", "dvisvgm": "latex"}
+if RENDER_BACKEND not in _ENGINES:
+    raise ValueError(f"Unknown TIKZ_RENDER_BACKEND: {RENDER_BACKEND}")
+
+TIKZ_FORMAT_NAME = "tikzpreamble"
+
+RENDER_STAGE = histogram(
+    "tikz_render_stage_seconds", "Time spent in each stage of a TikZ render", "stage"
+)
+
+_format_dir: Optional[Path] = None
+
+_PL_MAP = str.maketrans("ąćęłńóśźżĄĆĘŁŃÓŚŹŻ", "acelnoszzACELNOSZZ")
+
+
+class TikzRenderError(Exception):
+    """Raised when a diagram cannot be rendered; carries the HTTP status to report."""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+class RenderQueueFull(Exception):
+    """Raised when the render queue has no free slot; retry after `retry_after` seconds."""
+
+    def __init__(self, retry_after: int):
+        super().__init__("TikZ render queue is full")
+        self.retry_after = retry_after
+
+
+def prepare_tikz(raw: str) -> str:
+    """Sanitize TikZ code for web-based compilation."""
+    raw = re.sub(r'\\n(?![a-zA-Z])', '\n', raw)
+    raw = re.sub(r'\\t(?![a-zA-Z])', '\t', raw)
+    raw = raw.replace('\u00A0', ' ')
+
+    raw = raw.translate(_PL_MAP)
+
+    #raw = raw.replace("font=\\sffamily", "").replace("font=\\sansmath", "")
+    #raw = re.sub(r",\s*font=[^,\]]+", "", raw)
+    #raw = re.sub(r"font=[^,\]]+,\s*", "", raw)
+    #raw = re.sub(r"font=[^,\]\}]+", "", raw)
+
+    if "\\begin{center}" in raw:
+        raw = raw.replace("\\begin{center}", "").replace("\\end{center}", "").strip()
+
+    return raw
+
+
+def tikz_key(tikz: str) -> str:
+    """Content address of a prepared TikZ snippet (per render backend)."""
+    data = tikz if RENDER_BACKEND == "pdf2svg" else f"{RENDER_BACKEND}\n{tikz}"
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+def _preamble() -> str:
+    if RENDER_BACKEND == "dvisvgm":
+        return DVISVGM_DRIVER + TIKZ_PREAMBLE
+    return TIKZ_PREAMBLE
+
+
+def _format_build_dir() -> Path:
+    """Fixed per-backend directory the format is published to."""
+    if _cache.directory is not None:
+        return _cache.directory / "_format" / RENDER_BACKEND
+    return Path(tempfile.gettempdir()) / f"tikz-fmt-{RENDER_BACKEND}"
+
+
+def build_tikz_format() -> Optional[Path]:
+    """Precompile the preamble into a format for the backend's engine; returns its directory.
+
+    The format is built in a private directory and then swapped in with os.replace,
+    so a server rendering with the published format (while the CLI prerender or a
+    benchmark rebuilds it) never sees it missing or half written.
+    Disabled with TIKZ_PRELOAD_FORMAT=0. On failure renders fall back to
+    loading the full preamble every time.
+    """
+    global _format_dir
+    if os.environ.get("TIKZ_PRELOAD_FORMAT", "1") == "0":
+        return None
+
+    engine = _ENGINES[RENDER_BACKEND]
+    fmt_dir = _format_build_dir()
+    fmt_name = f"{TIKZ_FORMAT_NAME}.fmt"
+    try:
+        fmt_dir.mkdir(parents=True, exist_ok=True)
+        with tempfile.TemporaryDirectory(dir=fmt_dir.parent, prefix=f".{RENDER_BACKEND}-") as build:
+            build_dir = Path(build)
+            (build_dir / f"{TIKZ_FORMAT_NAME}.tex").write_text(
+                _preamble() + "\\begin{document}\n\\end{document}\n",
+                encoding="utf-8",
+            )
+            proc = subprocess.run(
+                [
+                    engine, "-ini", "-interaction=nonstopmode",
+                    f"-jobname={TIKZ_FORMAT_NAME}",
+                    f"&{engine}", "mylatexformat.ltx", f"{TIKZ_FORMAT_NAME}.tex",
+                ],
+                cwd=build_dir, capture_output=True, text=True, timeout=120
+            )
+            if not (build_dir / fmt_name).exists():
+                log_preview = (proc.stdout or "") + (proc.stderr or "")
+                logger.warning("tikz: preamble format build failed: %s", log_preview[-500:])
+                return None
+            os.replace(build_dir / fmt_name, fmt_dir / fmt_name)
+    except (OSError, subprocess.TimeoutExpired) as e:
+        logger.warning("tikz: preamble format build failed: %s", e)
+        return None
+
+    _format_dir = fmt_dir
+    logger.info("tikz: %s preamble format ready in %s", engine, fmt_dir)
+    return fmt_dir
+
+
+def _latex_command(tex_path: Path) -> tuple[list[str], Optional[dict]]:
+    """TeX argv (and env) for a render, using the preloaded format if built."""
+    cmd = [_ENGINES[RENDER_BACKEND], "-interaction=nonstopmode", "-halt-on-error"]
+    if _format_dir is None:
+        return cmd + [str(tex_path)], None
+    env = {**os.environ, "TEXFORMATS": f"{_format_dir}{os.pathsep}"}
+    return cmd + [f"-fmt={TIKZ_FORMAT_NAME}", str(tex_path)], env
+
+
+def _compile(tmp: str, name: str, body: str, timeout: int, stage: str = "") -> Path:
+    """Typeset `body` in the standalone preamble; returns the .pdf / .dvi path.
+
+    `stage` prefixes the timing labels (batch renders use "batch_").
+    """
+    tex_path = Path(tmp) / f"{name}.tex"
+    with RENDER_STAGE.time(f"{stage}write"):
+        tex_path.write_text(
+            _preamble()
+            + "\\begin{document}\n"
+            + body
+            + "\n\\end{document}\n",
+            encoding="utf-8",
+        )
+
+    # With the preloaded format, mylatexformat skips the preamble written above.
+    engine = _ENGINES[RENDER_BACKEND]
+    cmd, env = _latex_command(tex_path)
+    with RENDER_STAGE.time(f"{stage}latex"):
+        proc = subprocess.run(
+            cmd, cwd=tmp, env=env, capture_output=True, text=True, timeout=timeout
+        )
+    out_path = Path(tmp) / f"{name}.{'dvi' if RENDER_BACKEND == 'dvisvgm' else 'pdf'}"
+    if not out_path.exists():
+        log_preview = (proc.stdout or "") + (proc.stderr or "")
+        raise TikzRenderError(422, f"{engine} failed: {log_preview[-500:]}")
+    return out_path
+
+
+def _dvisvgm_error(proc: subprocess.CompletedProcess) -> TikzRenderError:
+    err = proc.stderr.decode("utf-8", "replace") if proc.stderr else ""
+    return TikzRenderError(500, f"dvisvgm error: {err[-500:]}")
+
+
+def render_svg(tikz: str) -> bytes:
+    """Compile prepared TikZ and convert it to SVG with the configured backend.
+
+    pdf2svg: pdflatex → PDF → pdf2svg. dvisvgm: latex → DVI → dvisvgm, with the
+    SVG read from stdout (no PDF and no SVG temp file). Blocking; raises
+    TikzRenderError on failure.
+    """
+    name = f"tikz_{uuid.uuid4().hex[:12]}"
+    with RENDER_STAGE.time("total"), tempfile.TemporaryDirectory() as tmp:
+        if RENDER_BACKEND == "dvisvgm":
+            dvi_path = _compile(tmp, name, tikz, timeout=30)
+            with RENDER_STAGE.time("convert"):
+                proc = subprocess.run(
+                    ["dvisvgm", *DVISVGM_ARGS, "--stdout", str(dvi_path)],
+                    cwd=tmp, capture_output=True, timeout=10
+                )
+            start = proc.stdout.find(b"<?xml")
+            if proc.returncode != 0 or start < 0:
+                raise _dvisvgm_error(proc)
+            return proc.stdout[start:]
+
+        # CZYSTY pdflatex. Żadnego wpisu 'dvisvgm' w nawiasach kwadratowych.
+        # 1. Kompilacja do twardego PDF. On nigdy nie gubi współrzędnych.
+        pdf_path = _compile(tmp, name, tikz, timeout=30)
+
+        # 2. Konwersja na SVG za pomocą pdf2svg (które działa, bo masz już poppler-data w systemie)
+        svg_path = Path(tmp) / f"{name}.svg"
+        with RENDER_STAGE.time("convert"):
+            pdf2svg = subprocess.run(
+                ["pdf2svg", str(pdf_path), str(svg_path)],
+                cwd=tmp, capture_output=True, text=True, timeout=10
+            )
+
+        if not svg_path.exists() or pdf2svg.returncode != 0:
+            err = (pdf2svg.stdout or "") + (pdf2svg.stderr or "")
+            raise TikzRenderError(500, f"pdf2svg error: {err}")
+
+        with RENDER_STAGE.time("read"):
+            return svg_path.read_bytes()
+
+
+def _page_number(path: Path) -> int:
+    return int(path.stem.rsplit("-", 1)[1])
+
+
+def render_svg_batch(tikzs: list[str]) -> list[bytes]:
+    """Compile several single-tikzpicture snippets as pages of one document.
+
+    The standalone `tikz` option puts every tikzpicture on its own page, so
+    page i of the output is snippet i. Raises TikzRenderError if the document
+    fails or the page count does not match; callers then render one by one.
+    """
+    name = f"tikzbatch_{uuid.uuid4().hex[:12]}"
+    with RENDER_STAGE.time("batch_total"), tempfile.TemporaryDirectory() as tmp:
+        out_path = _compile(tmp, name, "\n".join(tikzs), timeout=60, stage="batch_")
+
+        if RENDER_BACKEND == "dvisvgm":
+            with RENDER_STAGE.time("batch_convert"):
+                proc = subprocess.run(
+                    ["dvisvgm", *DVISVGM_ARGS, "--page=1-", f"--output={name}-%p.svg", str(out_path)],
+                    cwd=tmp, capture_output=True, timeout=10 + len(tikzs)
+                )
+            if proc.returncode != 0:
+                raise _dvisvgm_error(proc)
+        else:
+            with RENDER_STAGE.time("batch_convert"):
+                pdf2svg = subprocess.run(
+                    ["pdf2svg", str(out_path), str(Path(tmp) / f"{name}-%d.svg"), "all"],
+                    cwd=tmp, capture_output=True, text=True, timeout=10 + len(tikzs)
+                )
+            if pdf2svg.returncode != 0:
+                err = (pdf2svg.stdout or "") + (pdf2svg.stderr or "")
+                raise TikzRenderError(500, f"pdf2svg error: {err}")
+
+        pages = sorted(Path(tmp).glob(f"{name}-*.svg"), key=_page_number)
+        if len(pages) != len(tikzs):
+            raise TikzRenderError(500, "page count does not match batch size")
+
+        with RENDER_STAGE.time("batch_read"):
+            return [p.read_bytes() for p in pages]
+
+
+_XML_COMMENT = re.compile(rb"<!--.*?-->", re.S)
+_INTER_TAG_WS = re.compile(rb">\s+<")
+
+ENCODING_SUFFIXES = {"identity": "", "gzip": ".gz", "br": ".br"}
+
+
+def minify_svg(svg: bytes) -> bytes:
+    """Drop comments and inter-tag whitespace (pdf2svg output has no text nodes)."""
+    svg = _XML_COMMENT.sub(b"", svg)
+    svg = _INTER_TAG_WS.sub(b"><", svg)
+    return svg.strip()
+
+
+def _accepted_encodings(accept_encoding: str) -> set[str]:
+    """Codings an Accept-Encoding header allows; q=0 excludes one, "*" covers the unlisted."""
+    weights: dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        name, *params = (p.strip() for p in part.split(";"))
+        if not name:
+            continue
+        q = 1.0
+        for param in params:
+            attr, _, value = param.partition("=")
+            if attr.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        weights[name.lower()] = q
+    wildcard = weights.pop("*", 0.0)
+    accepted = {name for name, q in weights.items() if q > 0}
+    if wildcard > 0:
+        accepted |= {name for name in ("gzip", "br") if name not in weights}
+    return accepted
+
+
+class CachedSvg(NamedTuple):
+    """A rendered diagram in every encoding it is served with."""
+
+    svg: bytes
+    gzip: bytes
+    br: Optional[bytes]
+
+    @classmethod
+    def from_svg(cls, svg: bytes) -> "CachedSvg":
+        return cls(
+            svg=svg,
+            gzip=gzip.compress(svg, compresslevel=9, mtime=0),
+            br=brotli.compress(svg, quality=11) if brotli is not None else None,
+        )
+
+    def negotiate(self, accept_encoding: str) -> tuple[bytes, Optional[str]]:
+        """Body and Content-Encoding for a request's Accept-Encoding header."""
+        accepted = _accepted_encodings(accept_encoding)
+        if "br" in accepted and self.br is not None:
+            return self.br, "br"
+        if "gzip" in accepted:
+            return self.gzip, "gzip"
+        return self.svg, None
+
+
+class SvgCache:
+    """Two-level SVG cache: bounded in-memory LRU over a size-capped disk store.
+
+    SVGs are minified on write and kept precompressed. Disk entries live at
+    ``<dir>/<key[:2]>/<key>.svg`` (+ ``.gz``/``.br``); the ``.svg`` mtime is
+    bumped on every hit so eviction (oldest mtime first) approximates LRU
+    across restarts. The store is sized once on construction and tracked
+    incrementally; eviction runs in the writing (render) thread without
+    holding the lookup lock.
+    """
+
+    def __init__(self, directory: Optional[Path], max_items: int, max_disk_bytes: int):
+        self.directory = directory
+        self.max_items = max_items
+        self.max_disk_bytes = max_disk_bytes
+        self._memory: OrderedDict[str, CachedSvg] = OrderedDict()
+        self._lock = threading.Lock()
+        self._evict_lock = threading.Lock()
+        self._disk_bytes: Optional[int] = self._scan_disk_bytes() if directory is not None else None
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _path(self, key: str, encoding: str = "identity") -> Path:
+        return self.directory / key[:2] / f"{key}.svg{ENCODING_SUFFIXES[encoding]}"
+
+    def _remember(self, key: str, entry: CachedSvg) -> None:
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_items:
+            self._memory.popitem(last=False)
+
+    def _load(self, key: str) -> Optional[CachedSvg]:
+        path = self._path(key)
+        try:
+            svg = path.read_bytes()
+            os.utime(path)
+        except OSError:
+            return None
+        try:
+            compressed = {enc: self._path(key, enc).read_bytes() for enc in ("gzip", "br")
+                          if enc != "br" or brotli is not None}
+        except OSError:
+            # Written before precompression existed (or partially); rebuild the variants.
+            return CachedSvg.from_svg(minify_svg(svg))
+        return CachedSvg(svg=svg, gzip=compressed["gzip"], br=compressed.get("br"))
+
+    def _get_memory(self, key: str) -> Optional[CachedSvg]:
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+            return entry
+
+    def _get_disk(self, key: str) -> Optional[CachedSvg]:
+        if self.directory is not None:
+            entry = self._load(key)
+            if entry is not None:
+                with self._lock:
+                    self.disk_hits += 1
+                    self._remember(key, entry)
+                return entry
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def get(self, key: str) -> Optional[CachedSvg]:
+        entry = self._get_memory(key)
+        return entry if entry is not None else self._get_disk(key)
+
+    async def get_async(self, key: str) -> Optional[CachedSvg]:
+        """get() for the event loop: memory hits inline, disk reads in a worker thread."""
+        entry = self._get_memory(key)
+        if entry is not None:
+            return entry
+        return await asyncio.to_thread(self._get_disk, key)
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            if key in self._memory:
+                return True
+        return self.directory is not None and self._path(key).exists()
+
+    def put(self, key: str, svg: bytes) -> CachedSvg:
+        """Minify, precompress and store a freshly rendered SVG."""
+        entry = CachedSvg.from_svg(minify_svg(svg))
+        with self._lock:
+            self._remember(key, entry)
+        if self.directory is None:
+            return entry
+
+        written = 0
+        try:
+            self._path(key).parent.mkdir(parents=True, exist_ok=True)
+            existed = self._path(key).exists()
+            # Compressed variants first: a present .svg implies complete siblings.
+            for encoding, body in (("br", entry.br), ("gzip", entry.gzip), ("identity", entry.svg)):
+                if body is None:
+                    continue
+                path = self._path(key, encoding)
+                tmp_path = path.with_name(f"{path.name}.{uuid.uuid4().hex[:8]}.tmp")
+                tmp_path.write_bytes(body)
+                os.replace(tmp_path, path)
+                written += len(body)
+        except OSError as e:
+            logger.warning("tikz cache: failed to write %s: %s", key, e)
+            return entry
+
+        with self._lock:
+            if not existed:
+                self._disk_bytes += written
+            over = self._disk_bytes > self.max_disk_bytes
+        # One writer evicts at a time; the others just keep writing.
+        if over and self._evict_lock.acquire(blocking=False):
+            try:
+                self._evict_disk()
+            finally:
+                self._evict_lock.release()
+        return entry
+
+    def _scan_disk_bytes(self) -> int:
+        total = 0
+        for p in self.directory.glob("*/*.svg*"):
+            try:
+                total += p.stat().st_size
+            except OSError:
+                continue
+        return total
+
+    def _evict_disk(self) -> None:
+        """Delete least recently used entries until the store is at 90% of its cap."""
+        with self._lock:
+            excess = self._disk_bytes - int(self.max_disk_bytes * 0.9)
+        entries = []
+        for p in self.directory.glob("*/*.svg"):
+            key = p.name[:-len(".svg")]
+            variants = [self._path(key, enc) for enc in ENCODING_SUFFIXES]
+            try:
+                mtime = p.stat().st_mtime
+                size = sum(v.stat().st_size for v in variants if v.exists())
+            except OSError:
+                continue
+            entries.append((mtime, size, variants))
+        entries.sort(key=lambda e: e[0])
+
+        freed = evicted = 0
+        for _, size, variants in entries:
+            if freed >= excess:
+                break
+            for v in variants:
+                try:
+                    v.unlink()
+                except FileNotFoundError:
+                    pass
+                except OSError:
+                    continue
+            freed += size
+            evicted += 1
+        with self._lock:
+            self._disk_bytes -= freed
+            self.evictions += evicted
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            lookups = hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_ratio": round(hits / lookups, 4) if lookups else None,
+                "memory_items": len(self._memory),
+                "memory_max_items": self.max_items,
+                "disk_bytes": self._disk_bytes,
+                "disk_max_bytes": self.max_disk_bytes,
+                "disk_evictions": self.evictions,
+                "brotli": brotli is not None,
+            }
+
+
+def _build_cache() -> SvgCache:
+    cache_dir = os.environ.get("TIKZ_CACHE_DIR", "tikz_cache")
+    return SvgCache(
+        directory=Path(cache_dir) if cache_dir else None,
+        max_items=int(os.environ.get("TIKZ_CACHE_MEMORY_ITEMS", "512")),
+        max_disk_bytes=int(os.environ.get("TIKZ_CACHE_DISK_MB", "512")) * 1024 * 1024,
+    )
+
+
+_cache = _build_cache()
+
+
+def get_tikz_cache() -> SvgCache:
+    return _cache
+
+
+def render_cached(tikz: str) -> CachedSvg:
+    """Return the cached SVG for prepared TikZ, rendering it on a miss."""
+    key = tikz_key(tikz)
+    entry = _cache.get(key)
+    if entry is None:
+        entry = _cache.put(key, render_svg(tikz))
+    return entry
+
+
+class RenderQueue:
+    """Runs blocking renders on a dedicated pool with a bounded number of waiters.
+
+    At most `concurrency` renders execute at once and at most `queue_size` more
+    wait for a worker; anything beyond that is rejected with RenderQueueFull.
+    The pending counter is only touched from the event loop, so it needs no lock.
+    """
+
+    def __init__(self, concurrency: int, queue_size: int, retry_after: int):
+        self.concurrency = concurrency
+        self.max_pending = concurrency + queue_size
+        self.retry_after = retry_after
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="tikz-render")
+        self._pending = 0
+        self.rejected = 0
+
+    async def run(self, fn, *args):
+        if self._pending >= self.max_pending:
+            self.rejected += 1
+            raise RenderQueueFull(self.retry_after)
+        self._pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        finally:
+            self._pending -= 1
+
+    def submit(self, fn, *args) -> Future:
+        """Run fn on the render pool from outside the event loop (batch jobs such as prerender).
+
+        Not counted against max_pending: such callers bound their own backlog.
+        """
+        return self._executor.submit(fn, *args)
+
+    def stats(self) -> dict:
+        return {
+            "concurrency": self.concurrency,
+            "pending": self._pending,
+            "max_pending": self.max_pending,
+            "rejected": self.rejected,
+        }
+
+
+_queue = RenderQueue(
+    concurrency=int(os.environ.get("TIKZ_RENDER_CONCURRENCY", str(os.cpu_count() or 2))),
+    queue_size=int(os.environ.get("TIKZ_RENDER_QUEUE_SIZE", "32")),
+    retry_after=int(os.environ.get("TIKZ_RETRY_AFTER", "5")),
+)
+
+
+def get_render_queue() -> RenderQueue:
+    return _queue
+
+
+def resize_render_queue(concurrency: int) -> RenderQueue:
+    """Replace the render pool with one of `concurrency` workers.
+
+    For CLI tools that own their process (python -m app.prerender --workers); call
+    before any render is queued.
+    """
+    global _queue
+    _queue = RenderQueue(
+        concurrency=concurrency,
+        queue_size=_queue.max_pending - _queue.concurrency,
+        retry_after=_queue.retry_after,
+    )
+    return _queue
+
+
+def _render_and_store(tikz: str, key: str) -> CachedSvg:
+    return _cache.put(key, render_svg(tikz))
+
+
+# Single-flight: one render per content key at a time. The render runs as its own
+# task; every request for the key (the first one included) awaits it through
+# asyncio.shield, so a cancelled request never cancels the render or its followers.
+_inflight: dict[str, asyncio.Future] = {}
+_flight_stats = {"coalesced": 0}
+
+
+def _start(key: str, coro) -> asyncio.Future:
+    task = asyncio.ensure_future(coro)
+    _inflight[key] = task
+    task.add_done_callback(lambda t: _finish(key, t))
+    return task
+
+
+def _finish(key: str, task: asyncio.Future) -> None:
+    if _inflight.get(key) is task:
+        del _inflight[key]
+    if not task.cancelled():
+        task.exception()  # mark retrieved; awaiting requests (if any) still receive it
+
+
+async def _join(task: asyncio.Future) -> CachedSvg:
+    _flight_stats["coalesced"] += 1
+    return await asyncio.shield(task)
+
+
+def single_flight_stats() -> dict:
+    return {"in_flight": len(_inflight), "coalesced": _flight_stats["coalesced"]}
+
+
+async def render_cached_async(tikz: str) -> CachedSvg:
+    """Non-blocking render_cached: cache hits return inline, misses go through the queue.
+
+    Identical concurrent misses are coalesced into a single render.
+    """
+    key = tikz_key(tikz)
+    entry = await _cache.get_async(key)
+    if entry is not None:
+        return entry
+    if key in _inflight:
+        return await _join(_inflight[key])
+    return await asyncio.shield(_start(key, _queue.run(_render_and_store, tikz, key)))
+
+
+def _render_batch_and_store(tikzs: list[str], keys: list[str]) -> list[CachedSvg | Exception]:
+    """Render and store a batch in one executor job; each slot is a CachedSvg or its error.
+
+    A failed compile is bisected within the same job, so only the bad snippet fails
+    and the retries never compete for render queue slots.
+    """
+    try:
+        svgs = render_svg_batch(tikzs) if len(tikzs) > 1 else [render_svg(tikzs[0])]
+    except (TikzRenderError, subprocess.TimeoutExpired) as e:
+        if len(tikzs) == 1:
+            return [e]
+        mid = len(tikzs) // 2
+        return (_render_batch_and_store(tikzs[:mid], keys[:mid])
+                + _render_batch_and_store(tikzs[mid:], keys[mid:]))
+    return [_cache.put(key, svg) for key, svg in zip(keys, svgs)]
+
+
+async def _from_batch(batch: asyncio.Future, index: int) -> CachedSvg:
+    """One key's share of a shared compile."""
+    outcome = (await asyncio.shield(batch))[index]
+    if isinstance(outcome, Exception):
+        raise outcome
+    return outcome
+
+
+async def render_batch_async(tikzs: list[str]) -> list[CachedSvg | Exception]:
+    """Render many prepared snippets; each slot holds a CachedSvg or its own error.
+
+    Cache hits are filled inline and keys already being rendered elsewhere are
+    joined. Remaining misses containing exactly one tikzpicture share a single
+    compile; if that compile fails (one bad snippet halts the whole document)
+    the same job bisects the batch so only the bad slot fails.
+    RenderQueueFull for the shared compile propagates to the caller.
+    """
+    results: list[CachedSvg | Exception | None] = [None] * len(tikzs)
+    keys = [tikz_key(t) for t in tikzs]
+    unique = list(dict.fromkeys(keys))
+    cached = dict(zip(unique, await asyncio.gather(*(_cache.get_async(k) for k in unique))))
+
+    pending: dict[str, list[int]] = {}
+    for i, key in enumerate(keys):
+        entry = cached[key]
+        if entry is not None:
+            results[i] = entry
+        else:
+            pending.setdefault(key, []).append(i)
+
+    joined = {k: _inflight[k] for k in pending if k in _inflight}
+    fresh = [k for k in pending if k not in joined]
+    batchable = [k for k in fresh if tikzs[pending[k][0]].count("\\begin{tikzpicture}") == 1]
+    if len(batchable) < 2:
+        batchable = []
+
+    batch = None
+    if batchable:
+        batch = asyncio.ensure_future(_queue.run(
+            _render_batch_and_store, [tikzs[pending[k][0]] for k in batchable], batchable
+        ))
+    position = {k: i for i, k in enumerate(batchable)}
+    tasks = {}
+    for k in fresh:
+        tikz = tikzs[pending[k][0]]
+        if k in position:
+            tasks[k] = _start(k, _from_batch(batch, position[k]))
+        else:
+            tasks[k] = _start(k, _queue.run(_render_and_store, tikz, k))
+
+    if batch is not None:
+        await asyncio.shield(batch)
+
+    outcomes = await asyncio.gather(
+        *(asyncio.shield(t) for t in tasks.values()),
+        *(_join(t) for t in joined.values()),
+        return_exceptions=True,
+    )
+    for key, outcome in zip(list(tasks) + list(joined), outcomes):
+        for i in pending[key]:
+            results[i] = outcome
+
+    return results
+
+
+def _collect_metrics() -> str:
+    cache, queue, flight = _cache.stats(), _queue.stats(), single_flight_stats()
+    lines = [
+        "# TYPE tikz_cache_hits_total counter",
+        f'tikz_cache_hits_total{{tier="memory"}} {cache["memory_hits"]}',
+        f'tikz_cache_hits_total{{tier="disk"}} {cache["disk_hits"]}',
+        "# TYPE tikz_cache_misses_total counter",
+        f"tikz_cache_misses_total {cache['misses']}",
+        "# TYPE tikz_render_queue_pending gauge",
+        f"tikz_render_queue_pending {queue['pending']}",
+        "# TYPE tikz_render_queue_rejected_total counter",
+        f"tikz_render_queue_rejected_total {queue['rejected']}",
+        "# TYPE tikz_render_coalesced_total counter",
+        f"tikz_render_coalesced_total {flight['coalesced']}",
+    ]
+    return "\n".join(lines)
+
+
+register_collector(_collect_metrics)
@@ -0,0 +1,366 @@
+"""Time the recommendation engine on synthetic graphs and attempt histories of growing size.
+
+Generates Dzial/Umiejetnosc/Zadanie graphs (with WYMAGA prerequisites) and a class's
+attempt history, serves them through an in-memory stand-in for the Neo4j driver, and
+times the engine functions at each size. No Neo4j or Supabase needed. Run from the repo root:
+
+    python -m benchmarks.skill_engine
+    python -m benchmarks.skill_engine --sizes small,large --students 50 --repeat 3
+
+Every run is stored in benchmarks/results/ (named by git revision, "-dirty" for uncommitted
+trees, and time) and compared with the newest earlier result measured with the same seed,
+repeat count, students and attempts, so regressions show up between versions; pass
+--compare FILE to pick the baseline or --no-save for a throwaway run.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+# name: (dzialy, skills, tasks, attempts per class)
+SIZES = {
+    "small": (5, 100, 1_000, 10_000),
+    "medium": (10, 300, 5_000, 50_000),
+    "large": (20, 1_000, 10_000, 100_000),
+}
+
+
+# --- Synthetic data ---
+
+def make_graph(n_dzialy: int, n_skills: int, n_tasks: int, rng: random.Random) -> dict:
+    """Dzialy, skills (each in one dzial, requiring up to 2 earlier skills of that dzial) and tasks."""
+    dzialy = [{"id": d + 1, "nazwa": f"Dział {d + 1}"} for d in range(n_dzialy)]
+    skills, by_dzial, wymaga = [], {}, []
+    for i in range(n_skills):
+        did = i % n_dzialy + 1
+        sid = f"u{i:05d}"
+        earlier = by_dzial.setdefault(did, [])
+        for req in rng.sample(earlier, min(len(earlier), rng.randint(0, 2))):
+            wymaga.append((sid, req))
+        earlier.append(sid)
+        skills.append({"id": sid, "opis": f"Umiejętność {i}", "dzial_id": did})
+    skill_ids = [s["id"] for s in skills]
+    tasks = {}
+    for i in range(n_tasks):
+        zid = f"z{i:06d}"
+        tasks[zid] = {
+            "props": {
+                "id": zid,
+                "numer": i % 40 + 1,
+                "data": f"20{10 + i % 15}-05",
+                "punkty": rng.choice([1, 2, 3, 4]),
+                "typ": rng.choice(["zamkniete", "otwarte"]),
+                "podtyp": "",
+                "tresc": "Oblicz $x^2 + %d$." % i,
+                "odpowiedzi": ["A", "B", "C", "D"],
+                "tikz": "",
+            },
+            "skills": rng.sample(skill_ids, rng.randint(1, 3)),
+        }
+    return {"dzialy": dzialy, "skills": skills, "wymaga": wymaga, "tasks": tasks}
+
+
+def make_attempts(graph: dict, user_ids: list[str], n_attempts: int, rng: random.Random) -> list[dict]:
+    """task_attempts rows over the last 60 days; each student practices a subset of tasks."""
+    task_ids = list(graph["tasks"])
+    now = datetime.now(timezone.utc)
+    pools = {uid: rng.sample(task_ids, min(len(task_ids), max(20, n_attempts // len(user_ids) // 2)))
+             for uid in user_ids}
+    rows = []
+    for _ in range(n_attempts):
+        uid = rng.choice(user_ids)
+        rows.append({
+            "user_id": uid,
+            "zadanie_id": rng.choice(pools[uid]),
+            "is_correct": rng.random() < 0.65,
+            "answer_data": {"hints_used": rng.choice([0, 0, 0, 1, 2])},
+            "ai_feedback": {"poprawne_rozumowanie": rng.choice([True, True, False, None])},
+            "created_at": (now - timedelta(seconds=rng.randrange(60 * 86400))).isoformat(),
+        })
+    return rows
+
+
+# --- In-memory stand-in for the Neo4j driver ---
+
+class _Result(list):
+    def single(self):
+        return self[0] if self else None
+
+
+class FakeSession:
+    """Answers the queries skill_engine issues, from the synthetic graph."""
+
+    def __init__(self, graph: dict, opis: dict[str, str]):
+        self.g = graph
+        self.opis = opis
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def _task_record(self, zid: str) -> dict:
+        task = self.g["tasks"][zid]
+        return {"z": task["props"], "umiejetnosci": [{"id": s, "opis": self.opis[s]} for s in task["skills"]]}
+
+    def run(self, query: str, **params) -> _Result:
+        q = " ".join(query.split())
+        g = self.g
+        if "MATCH (z:Zadanie {id: $zid})" in q:
+            return _Result([self._task_record(params["zid"])] if params["zid"] in g["tasks"] else [])
+        if "WHERE z.id IN $zids" in q:
+            return _Result(self._task_record(z) for z in params["zids"] if z in g["tasks"])
+        if q == "MATCH (z:Zadanie) RETURN z.id AS id":
+            return _Result({"id": z} for z in g["tasks"])
+        if "collect(u.id) AS sids" in q:
+            return _Result({"zid": z, "sids": list(t["skills"])} for z, t in g["tasks"].items())
+        if q == "MATCH (u:Umiejetnosc) RETURN u.id AS id":
+            return _Result({"id": s["id"]} for s in g["skills"])
+        if "[:WYMAGA]" in q:
+            return _Result({"from_id": a, "to_id": b} for a, b in g["wymaga"])
+        if "RETURN u.id AS uid, d.id AS did" in q:
+            return _Result({"uid": s["id"], "did": s["dzial_id"]} for s in g["skills"])
+        if "RETURN d.id AS id, d.nazwa AS nazwa" in q:
+            return _Result(dict(d) for d in g["dzialy"])
+        if "u.opis AS opis, d.id AS dzial_id" in q:
+            return _Result(dict(s) for s in g["skills"])
+        raise NotImplementedError(f"benchmark session has no answer for: {q[:80]}")
+
+
+class FakeDriver:
+    def __init__(self, graph: dict):
+        self.graph = graph
+        self.opis = {s["id"]: s["opis"] for s in graph["skills"]}
+
+    def session(self, **kwargs) -> FakeSession:
+        return FakeSession(self.graph, self.opis)
+
+
+# --- Measurement ---
+
+def _time(fn, calls: int, repeat: int) -> dict:
+    """Best-of-repeat timing of `calls` invocations: mean/p95 per call and calls per second."""
+    runs = []
+    for _ in range(repeat):
+        per_call = []
+        for i in range(calls):
+            start = time.perf_counter()
+            fn(i)
+            per_call.append(time.perf_counter() - start)
+        runs.append(per_call)
+    best = min(runs, key=sum)
+    total = sum(best)
+    best.sort()
+    return {
+        "calls": calls,
+        "mean_ms": round(total / calls * 1000, 3),
+        "p95_ms": round(best[min(len(best) - 1, int(len(best) * 0.95))] * 1000, 3),
+        "per_s": round(calls / total, 1) if total else None,
+    }
+
+
+def _peak_kib(fn) -> float:
+    """Peak traced allocation of one call (run separately: tracing slows the timed runs)."""
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    try:
+        fn(0)
+        return round(tracemalloc.get_traced_memory()[1] / 1024, 1)
+    finally:
+        tracemalloc.stop()
+
+
+def run_size(name: str, students: int, repeat: int, seed: int) -> dict:
+    from app.mastery_batch import compute_mastery_matrix
+    from app.skill_engine import compute_skill_mastery, fetch_skill_map, recommend_task
+    from app.skill_graph import load_graph_snapshot
+
+    n_dzialy, n_skills, n_tasks, n_attempts = SIZES[name]
+    rng = random.Random(seed)
+    synthetic = make_graph(n_dzialy, n_skills, n_tasks, rng)
+    user_ids = [f"student-{i:04d}" for i in range(students)]
+    rows = make_attempts(synthetic, user_ids, n_attempts, rng)
+    by_user: dict[str, list[dict]] = {uid: [] for uid in user_ids}
+    for row in sorted(rows, key=lambda r: r["created_at"], reverse=True):
+        by_user[row["user_id"]].append(row)
+    driver = FakeDriver(synthetic)
+    graph = load_graph_snapshot(driver)
+    zmap = graph.zadanie_skill_map
+
+    def student(i: int) -> tuple[str, list[dict]]:
+        uid = user_ids[i % students]
+        return uid, by_user[uid]
+
+    masteries = {uid: compute_skill_mastery(atts, zmap) for uid, atts in by_user.items()}
+    cases = {
+        "load_graph_snapshot": (lambda i: load_graph_snapshot(driver), 1),
+        "compute_skill_mastery": (lambda i: compute_skill_mastery(student(i)[1], zmap), students),
+        "fetch_skill_map": (lambda i: fetch_skill_map(graph, student(i)[1]), students),
+        "fetch_skill_map_stored_mastery": (
+            lambda i: fetch_skill_map(graph, [], mastery=masteries[student(i)[0]]), students
+        ),
+        "recommend_task": (
+            lambda i: recommend_task(driver, graph, student(i)[0], student(i)[1]), students
+        ),
+        "recommend_task_stored_mastery": (
+            lambda i: recommend_task(driver, graph, student(i)[0], student(i)[1], mastery=masteries[student(i)[0]]),
+            students,
+        ),
+        "compute_mastery_matrix": (lambda i: compute_mastery_matrix(rows, graph, user_ids), 1),
+    }
+
+    tracemalloc.start()
+    load_graph_snapshot(driver)
+    snapshot_kib = round(tracemalloc.get_traced_memory()[0] / 1024, 1)
+    tracemalloc.stop()
+
+    results = {}
+    for case, (fn, calls) in cases.items():
+        timing = _time(fn, calls, repeat)
+        timing["peak_kib"] = _peak_kib(fn)
+        results[case] = timing
+        print(f"  {name:<7} {case:<32} {timing['mean_ms']:>10.3f} ms  {timing['per_s']:>10} /s"
+              f"  peak {timing['peak_kib']:>10.1f} KiB", file=sys.stderr)
+    return {
+        "dzialy": n_dzialy,
+        "skills": n_skills,
+        "tasks": n_tasks,
+        "wymaga_edges": len(synthetic["wymaga"]),
+        "students": students,
+        "attempts": n_attempts,
+        "snapshot_kib": snapshot_kib,
+        "functions": results,
+    }
+
+
+def _git_revision() -> str:
+    """Short commit hash, with a -dirty suffix when the working tree has uncommitted changes."""
+    try:
+        out = subprocess.run(
+            ["git", "describe", "--always", "--dirty", "--abbrev=7"], capture_output=True, text=True, check=True,
+            cwd=Path(__file__).resolve().parent,
+        )
+        return out.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def _mismatches(report: dict, baseline: dict) -> list[str]:
+    """Run settings that differ between two reports (timings are not comparable then)."""
+    diffs = [
+        f"{key} {baseline.get(key)} != {report[key]}"
+        for key in ("seed", "repeat") if baseline.get(key) != report[key]
+    ]
+    shared = [size for size in report["sizes"] if size in baseline.get("sizes", {})]
+    if not shared:
+        diffs.append("no sizes in common")
+    for size in shared:
+        for key in ("students", "attempts"):
+            old, new = baseline["sizes"][size].get(key), report["sizes"][size][key]
+            if old != new:
+                diffs.append(f"{size} {key} {old} != {new}")
+    return diffs
+
+
+def _latest_result(report: dict) -> tuple[Path, dict] | None:
+    """Newest stored result (by its created_at; file mtimes change on checkout) with matching settings."""
+    dated = []
+    for path in RESULTS_DIR.glob("skill_engine-*.json"):
+        try:
+            baseline = json.loads(path.read_text(encoding="utf-8"))
+            dated.append((baseline["created_at"], path, baseline))
+        except (OSError, ValueError, KeyError):
+            continue
+    for _, path, baseline in sorted(dated, key=lambda d: d[0], reverse=True):
+        if not _mismatches(report, baseline):
+            return path, baseline
+    return None
+
+
+def compare(report: dict, baseline: dict, threshold: float) -> list[str]:
+    """Lines for every function whose mean time grew by more than threshold (e.g. 0.2 = +20%)."""
+    lines = []
+    for size, data in report["sizes"].items():
+        old_size = baseline.get("sizes", {}).get(size)
+        if not old_size:
+            continue
+        for case, timing in data["functions"].items():
+            old = old_size["functions"].get(case)
+            if not old or not old["mean_ms"]:
+                continue
+            ratio = timing["mean_ms"] / old["mean_ms"]
+            if ratio > 1 + threshold:
+                lines.append(f"{size}/{case}: {old['mean_ms']} ms -> {timing['mean_ms']} ms (x{ratio:.2f})")
+    return lines
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark skill_engine on synthetic graphs.")
+    parser.add_argument("--sizes", default="small,medium,large", help=f"comma-separated, from {', '.join(SIZES)}")
+    parser.add_argument("--students", type=int, default=30, help="students per class (attempts are split among them)")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per function (best is kept)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--compare", type=Path, default=None, help="baseline result (default: newest in results/)")
+    parser.add_argument("--threshold", type=float, default=0.2, help="report slowdowns above this fraction")
+    parser.add_argument("--no-save", action="store_true", help="do not store the result in benchmarks/results/")
+    args = parser.parse_args()
+
+    sizes = [s.strip() for s in args.sizes.split(",") if s.strip()]
+    unknown = [s for s in sizes if s not in SIZES]
+    if unknown:
+        raise SystemExit(f"Unknown sizes: {', '.join(unknown)}")
+
+    # app.services needs Supabase settings at import time; the benchmark never calls Supabase
+    os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+    os.environ.setdefault("SUPABASE_KEY", "benchmark")
+
+    revision = _git_revision()
+    report = {
+        "revision": revision,
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "seed": args.seed,
+        "repeat": args.repeat,
+        "sizes": {name: run_size(name, args.students, args.repeat, args.seed) for name in sizes},
+    }
+
+    json.dump(report, sys.stdout, indent=2)
+    print()
+    if args.compare:
+        found = (args.compare, json.loads(args.compare.read_text(encoding="utf-8")))
+    else:
+        found = _latest_result(report)
+    if found is None:
+        print("No earlier result with the same settings to compare with", file=sys.stderr)
+    elif diffs := _mismatches(report, found[1]):
+        print(f"Not comparing with {found[0].name}: different settings ({'; '.join(diffs)})", file=sys.stderr)
+    else:
+        regressions = compare(report, found[1], args.threshold)
+        print(f"Compared with {found[0].name}: "
+              + ("no slowdowns" if not regressions else f"{len(regressions)} slowdown(s)"), file=sys.stderr)
+        for line in regressions:
+            print("  " + line, file=sys.stderr)
+    if not args.no_save:
+        RESULTS_DIR.mkdir(exist_ok=True)
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
+        out = RESULTS_DIR / f"skill_engine-{revision}-{stamp}.json"
+        out.write_text(json.dumps(report, indent=2) + "\n", encoding="utf-8")
+        print(f"Saved {out.relative_to(RESULTS_DIR.parent.parent)}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
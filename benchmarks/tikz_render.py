@@ -0,0 +1,140 @@
+"""Replay real task diagrams through the TikZ renderer and report latency/throughput.
+
+Renders bypass the SVG cache, so every diagram is compiled. Run from the repo root:
+
+    python -m benchmarks.tikz_render --corpus neo4j --concurrency 4
+    python -m benchmarks.tikz_render --corpus diagrams.jsonl --backend dvisvgm --json out.json
+
+A file corpus is JSONL with a "tikz" field per line (e.g. exported tasks) or a
+directory of *.tex snippets. Compare backends and preamble formats by running
+the same corpus with different --backend / --no-format flags.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+
+def _load_file_corpus(path: Path) -> list[str]:
+    if path.is_dir():
+        return [p.read_text(encoding="utf-8") for p in sorted(path.glob("*.tex"))]
+    raws = []
+    with path.open(encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                raws.append(json.loads(line).get("tikz") or "")
+    return raws
+
+
+def _load_neo4j_corpus(page_size: int = 500) -> list[str]:
+    from app.neo4j import close_neo4j, init_neo4j
+    from app.skill_engine import fetch_all_tasks
+
+    driver = init_neo4j()
+    if not driver:
+        raise SystemExit("Neo4j not available (check NEO4J_URI / NEO4J_AUTH)")
+    raws, after = [], None
+    try:
+        while True:
+            page = fetch_all_tasks(driver, limit=page_size, after=after, fields=("id", "tikz"))
+            raws.extend(t.get("tikz") or "" for t in page)
+            if len(page) < page_size:
+                return raws
+            after = page[-1]["id"]
+    finally:
+        close_neo4j()
+
+
+def _percentile(sorted_values: list[float], pct: float) -> float:
+    if len(sorted_values) == 1:
+        return sorted_values[0]
+    return statistics.quantiles(sorted_values, n=100, method="inclusive")[int(pct) - 1]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark TikZ → SVG rendering on a diagram corpus.")
+    parser.add_argument("--corpus", default="neo4j", help='"neo4j" or a JSONL file / directory of .tex files')
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=1, help="replay the corpus this many times")
+    parser.add_argument("--limit", type=int, default=None, help="use only the first N distinct diagrams")
+    parser.add_argument("--backend", choices=["pdf2svg", "dvisvgm"], default=None)
+    parser.add_argument("--no-format", action="store_true", help="do not preload the preamble format")
+    parser.add_argument("--json", type=Path, default=None, help="also write the report to this file")
+    args = parser.parse_args()
+
+    # app.tikz reads its configuration at import time
+    if args.backend:
+        os.environ["TIKZ_RENDER_BACKEND"] = args.backend
+    if args.no_format:
+        os.environ["TIKZ_PRELOAD_FORMAT"] = "0"
+    from app.ai import fix_latex_json_corruption
+    from app.tikz import RENDER_BACKEND, RENDER_STAGE, build_tikz_format, prepare_tikz, render_svg
+
+    raws = _load_neo4j_corpus() if args.corpus == "neo4j" else _load_file_corpus(Path(args.corpus))
+    diagrams = list(dict.fromkeys(
+        t for t in (prepare_tikz(fix_latex_json_corruption(r)) for r in raws) if t.strip()
+    ))
+    if args.limit:
+        diagrams = diagrams[: args.limit]
+    if not diagrams:
+        raise SystemExit("Corpus contains no diagrams")
+
+    format_start = time.perf_counter()
+    fmt = build_tikz_format()
+    format_seconds = time.perf_counter() - format_start
+    RENDER_STAGE.reset()
+
+    def timed_render(tikz: str) -> tuple[float, bool]:
+        start = time.perf_counter()
+        try:
+            render_svg(tikz)
+            ok = True
+        except Exception:
+            ok = False
+        return time.perf_counter() - start, ok
+
+    work = diagrams * args.repeat
+    wall_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        outcomes = list(pool.map(timed_render, work))
+    wall = time.perf_counter() - wall_start
+
+    latencies = sorted(d for d, ok in outcomes if ok)
+    failures = sum(1 for _, ok in outcomes if not ok)
+    stages = {
+        stage: round(total / count * 1000, 2)
+        for stage, (count, total) in sorted(RENDER_STAGE.snapshot().items())
+        if count
+    }
+    report = {
+        "backend": RENDER_BACKEND,
+        "preloaded_format": fmt is not None,
+        "format_build_s": round(format_seconds, 3) if fmt is not None else None,
+        "diagrams": len(diagrams),
+        "renders": len(work),
+        "failures": failures,
+        "concurrency": args.concurrency,
+        "wall_s": round(wall, 3),
+        "renders_per_s": round(len(latencies) / wall, 2) if wall else None,
+        "p50_ms": round(_percentile(latencies, 50) * 1000, 1) if latencies else None,
+        "p95_ms": round(_percentile(latencies, 95) * 1000, 1) if latencies else None,
+        "p99_ms": round(_percentile(latencies, 99) * 1000, 1) if latencies else None,
+        "stage_mean_ms": stages,
+    }
+
+    json.dump(report, sys.stdout, indent=2)
+    print()
+    if args.json:
+        args.json.write_text(json.dumps(report, indent=2) + "\n", encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
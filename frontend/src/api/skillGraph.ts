@@ -0,0 +1,33 @@
+import { apiGet } from './client';
+
+export interface SkillGraph {
+  version: string;
+  dzialy: { id: number; nazwa: string }[];
+  umiejetnosci: { id: string; opis: string; dzial_id: number }[];
+  wymaga_edges: { from: string; to: string }[];
+}
+
+export interface SkillMapOverlay<M> {
+  version: string;
+  mastery: Record<string, M>;
+}
+
+// The graph changes only on content imports: keep it for the session and refetch
+// (ETag-revalidated by the browser) only when an overlay reports another version.
+let cachedGraph: SkillGraph | null = null;
+
+function fetchSkillGraph(): Promise<SkillGraph> {
+  return apiGet<SkillGraph>('/tasks/skill-graph');
+}
+
+/** Static skill graph merged with a per-student overlay (/tasks/skill-map or the admin one). */
+export async function loadSkillMap<M>(
+  overlayPath: string,
+): Promise<SkillGraph & { mastery: Record<string, M> }> {
+  const [graph, overlay] = await Promise.all([
+    cachedGraph ? Promise.resolve(cachedGraph) : fetchSkillGraph(),
+    apiGet<SkillMapOverlay<M>>(overlayPath),
+  ]);
+  cachedGraph = graph.version === overlay.version ? graph : await fetchSkillGraph();
+  return { ...cachedGraph, mastery: overlay.mastery };
+}
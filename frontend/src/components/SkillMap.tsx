@@ -1,5 +1,5 @@
 import { useState, useEffect, useCallback } from 'react';
-import { apiGet } from '../api/client';
+import { loadSkillMap } from '../api/skillGraph';
 import MathContent from './MathContent';
 import Spinner from './Spinner';
 
@@ -7,6 +7,7 @@ interface SkillMastery {
   level: number;
   attempts: number;
   status: 'mastered' | 'in_progress' | 'available' | 'locked';
+  prereqs_met?: boolean;
 }
 
 interface UmiejetnoscNode {
@@ -82,7 +83,7 @@ export default function SkillMap({ onPracticeSkill }: SkillMapProps) {
     setLoading(true);
     setError(null);
     try {
-      const d = await apiGet<SkillMapData>('/tasks/skill-map');
+      const d: SkillMapData = await loadSkillMap<SkillMastery>('/tasks/skill-map');
       setData(d);
       setExpandedDzialy(new Set(d.dzialy.map(dz => dz.id)));
     } catch (e) {
@@ -392,6 +393,12 @@ export default function SkillMap({ onPracticeSkill }: SkillMapProps) {
                 </div>
               )}
 
+              {selectedMastery?.prereqs_met === false && selectedMastery.status !== 'locked' && (
+                <p className="text-xs text-amber-600 mb-3">
+                  Nie wszystkie wymagane umiejętności są jeszcze opanowane.
+                </p>
+              )}
+
               {/* Practice button */}
               {(selectedMastery?.status === 'available' ||
                 selectedMastery?.status === 'in_progress' ||
@@ -1,5 +1,6 @@
 import { useState, useEffect, useCallback } from 'react';
 import { apiGet, apiPost, apiDelete } from '../api/client';
+import { loadSkillMap } from '../api/skillGraph';
 import MathContent from './MathContent';
 import LessonEditModal from './LessonEditModal';
 import type {
@@ -88,11 +89,9 @@ export default function StudentProgressPanel({
     setSkillMapLoading(true);
     setSkillMapError(null);
     try {
-      const d = await apiGet<{
-        dzialy: { id: number; nazwa: string }[];
-        umiejetnosci: { id: string; opis: string; dzial_id: number }[];
-        mastery: Record<string, { status: string }>;
-      }>(`/admin/students/${studentId}/skill-map`);
+      const d = await loadSkillMap<{ status: string }>(
+        `/admin/students/${studentId}/skill-map`,
+      );
       setSkillMapData(d);
     } catch {
       setSkillMapError('Nie udało się pobrać mapy umiejętności.');
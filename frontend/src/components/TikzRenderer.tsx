@@ -20,6 +20,130 @@ function toBase64Utf8(s: string): string {
   return btoa(unescape(encodeURIComponent(s)));
 }
 
+const MAX_BUSY_RETRIES = 3;
+const MAX_BATCH = 50;
+
+/** POST JSON; when the renderer is busy (503), wait Retry-After seconds and retry. */
+async function postWithBusyRetry(path: string, body: unknown): Promise<Response> {
+  for (let attempt = 0; ; attempt++) {
+    const res = await fetch(path, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify(body),
+    });
+    if (res.status !== 503 || attempt >= MAX_BUSY_RETRIES) return res;
+    const retryAfter = Number(res.headers.get('Retry-After')) || 2;
+    await new Promise((resolve) => setTimeout(resolve, retryAfter * 1000));
+  }
+}
+
+async function errorDetail(res: Response): Promise<string> {
+  const data = await res.json().catch(() => ({}));
+  const detail = typeof data.detail === 'string' ? data.detail : JSON.stringify(data.detail);
+  return detail || `HTTP ${res.status}`;
+}
+
+interface BatchResponse {
+  svgs: Record<string, string>;
+  keys: Record<string, string>;
+  errors: Record<string, { status: number; detail: string }>;
+}
+
+interface RenderedSvg {
+  svg: string;
+  url: string | null;
+}
+
+interface PendingRender {
+  t: string;
+  resolve: (rendered: RenderedSvg) => void;
+  reject: (e: Error) => void;
+}
+
+let queued: PendingRender[] = [];
+let flushTimer: ReturnType<typeof setTimeout> | null = null;
+
+/** Diagrams requested in the same tick share one POST /api/tikz-svg/batch (one TeX run). */
+function requestTikzSvg(t: string): Promise<RenderedSvg> {
+  return new Promise((resolve, reject) => {
+    queued.push({ t, resolve, reject });
+    if (flushTimer === null) flushTimer = setTimeout(flushQueued, 0);
+  });
+}
+
+async function flushQueued() {
+  const batch = queued.slice(0, MAX_BATCH);
+  queued = queued.slice(MAX_BATCH);
+  flushTimer = queued.length ? setTimeout(flushQueued, 0) : null;
+
+  try {
+    if (batch.length === 1) {
+      const res = await postWithBusyRetry('/api/tikz-svg', { t: batch[0].t });
+      if (!res.ok) throw new Error(await errorDetail(res));
+      batch[0].resolve({ svg: await res.text(), url: res.headers.get('Content-Location') });
+      return;
+    }
+
+    const res = await postWithBusyRetry('/api/tikz-svg/batch', { items: batch.map((p) => p.t) });
+    if (!res.ok) throw new Error(await errorDetail(res));
+    const data: BatchResponse = await res.json();
+    batch.forEach((p, i) => {
+      const svg = data.svgs[String(i)];
+      const key = data.keys[String(i)];
+      if (svg !== undefined) p.resolve({ svg, url: key ? `/api/tikz-svg/${key}` : null });
+      else p.reject(new Error(data.errors[String(i)]?.detail || 'Nie udało się wyrenderować diagramu.'));
+    });
+  } catch (e) {
+    const err = e instanceof Error ? e : new Error('Nie udało się wyrenderować diagramu.');
+    batch.forEach((p) => p.reject(err));
+  }
+}
+
+// Rendered diagrams have immutable GET URLs (/api/tikz-svg/<hash>); remember them per
+// payload so later views are served from the browser HTTP cache instead of re-POSTing.
+const URL_STORE_KEY = 'tikz-svg-urls';
+const MAX_STORED_URLS = 500;
+
+function storedUrls(): Record<string, string> {
+  try {
+    return JSON.parse(localStorage.getItem(URL_STORE_KEY) || '{}');
+  } catch {
+    return {};
+  }
+}
+
+function rememberUrl(digest: string, url: string) {
+  const urls = storedUrls();
+  urls[digest] = url;
+  const digests = Object.keys(urls);
+  for (const old of digests.slice(0, Math.max(0, digests.length - MAX_STORED_URLS))) {
+    delete urls[old];
+  }
+  try {
+    localStorage.setItem(URL_STORE_KEY, JSON.stringify(urls));
+  } catch {
+    // storage full or disabled - caching is best effort
+  }
+}
+
+async function digestOf(t: string): Promise<string | null> {
+  if (!globalThis.crypto?.subtle) return null;
+  const buf = await crypto.subtle.digest('SHA-256', new TextEncoder().encode(t));
+  return Array.from(new Uint8Array(buf), (b) => b.toString(16).padStart(2, '0')).join('');
+}
+
+async function loadTikzSvg(t: string): Promise<string> {
+  const digest = await digestOf(t);
+  const url = digest ? storedUrls()[digest] : undefined;
+  if (url) {
+    const res = await fetch(url);
+    if (res.ok) return res.text();
+  }
+  const rendered = await requestTikzSvg(t);
+  if (digest && rendered.url) rememberUrl(digest, rendered.url);
+  return rendered.svg;
+}
+
 export default function TikzRenderer({ code }: TikzRendererProps) {
   const [svg, setSvg] = useState<string | null>(null);
   const [error, setError] = useState<string | null>(null);
@@ -38,21 +162,7 @@ export default function TikzRenderer({ code }: TikzRendererProps) {
     const decoded = decodeTikzCode(code);
     const t = toBase64Utf8(decoded);
 
-    fetch('/api/tikz-svg', {
-      method: 'POST',
-      headers: { 'Content-Type': 'application/json' },
-      body: JSON.stringify({ t }),
-    })
-      .then(async (res) => {
-        if (!res.ok) {
-          const data = await res.json().catch(() => ({}));
-          const detail = typeof data.detail === 'string' ? data.detail : JSON.stringify(data.detail);
-          console.error('[TikzRenderer] Server error:', res.status, detail);
-          console.error('[TikzRenderer] TikZ code (first 600 chars):', decoded.slice(0, 600));
-          throw new Error(detail || `HTTP ${res.status}`);
-        }
-        return res.text();
-      })
+    loadTikzSvg(t)
       .then((text) => {
         setSvg(text);
         setError(null);
@@ -60,6 +170,7 @@ export default function TikzRenderer({ code }: TikzRendererProps) {
       .catch((e) => {
         const msg = e instanceof Error ? e.message : 'Nie udało się wyrenderować diagramu.';
         console.error('[TikzRenderer] Render failed:', msg);
+        console.error('[TikzRenderer] TikZ code (first 600 chars):', decoded.slice(0, 600));
         setError(msg);
         setSvg(null);
       })
@@ -77,7 +77,8 @@ export default function TasksView({ onBack }: TasksViewProps) {
     setLoading(true);
     setError(null);
     try {
-      const data = await apiGet<Zadanie[]>('/tasks/all?limit=500');
+      // List view renders only these; the full task is fetched when opened
+      const data = await apiGet<Zadanie[]>('/tasks/all?limit=500&fields=id,numer,data,punkty');
       setTasks(data);
       setTask(null);
     } catch (e) {
@@ -89,6 +90,20 @@ export default function TasksView({ onBack }: TasksViewProps) {
     }
   }, []);
 
+  const openListedTask = useCallback(async (zadanieId: string) => {
+    setLoading(true);
+    setError(null);
+    try {
+      const data = await apiGet<Zadanie>(`/tasks/${encodeURIComponent(zadanieId)}`);
+      setTask(data);
+    } catch (e) {
+      setError(e instanceof Error ? e.message : 'Nie udało się pobrać zadania.');
+      setTask(null);
+    } finally {
+      setLoading(false);
+    }
+  }, []);
+
   useEffect(() => {
     loadDzialy();
   }, [loadDzialy]);
@@ -120,7 +135,7 @@ export default function TasksView({ onBack }: TasksViewProps) {
     if (mode === 'all' && tasks.length > 1 && task) {
       const idx = tasks.findIndex(t => t.id === task.id);
       const prevIdx = idx > 0 ? idx - 1 : tasks.length - 1;
-      setTask(tasks[prevIdx]);
+      openListedTask(tasks[prevIdx].id);
     }
   }
 
@@ -128,7 +143,11 @@ export default function TasksView({ onBack }: TasksViewProps) {
     if ((mode === 'dzial' || mode === 'all') && tasks.length > 1) {
       const idx = tasks.findIndex(t => t.id === task?.id);
       const nextIdx = idx >= 0 && idx < tasks.length - 1 ? idx + 1 : 0;
-      setTask(tasks[nextIdx]);
+      if (mode === 'all') {
+        openListedTask(tasks[nextIdx].id);
+      } else {
+        setTask(tasks[nextIdx]);
+      }
     } else if (mode === 'random') {
       loadRandom();
     } else if (mode === 'all') {
@@ -257,7 +276,7 @@ export default function TasksView({ onBack }: TasksViewProps) {
           {tasks.map(t => (
             <button
               key={t.id}
-              onClick={() => setTask(t)}
+              onClick={() => openListedTask(t.id)}
               className="w-full text-left bg-white border border-gray-200 rounded-xl p-4 hover:border-indigo-300 hover:bg-indigo-50/50 transition"
             >
               <div className="flex justify-between items-center">